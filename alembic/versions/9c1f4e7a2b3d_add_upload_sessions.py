@@ -0,0 +1,45 @@
+"""Add upload_sessions and upload_parts tables
+
+Revision ID: 9c1f4e7a2b3d
+Revises: 8b3e2a1c4d5f
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '9c1f4e7a2b3d'
+down_revision: Union[str, Sequence[str], None] = '8b3e2a1c4d5f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    op.create_table('upload_sessions',
+        sa.Column('id', sa.String(), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=True),
+        sa.Column('filename', sa.String(), nullable=True),
+        sa.Column('size', sa.BigInteger(), nullable=True),
+        sa.Column('share_public_id', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_upload_sessions_owner_id'), 'upload_sessions', ['owner_id'], unique=False)
+    op.create_index(op.f('ix_upload_sessions_expires_at'), 'upload_sessions', ['expires_at'], unique=False)
+
+    op.create_table('upload_parts',
+        sa.Column('session_id', sa.String(), nullable=False),
+        sa.Column('part_number', sa.Integer(), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=True),
+        sa.ForeignKeyConstraint(['session_id'], ['upload_sessions.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('session_id', 'part_number')
+    )
+
+def downgrade() -> None:
+    op.drop_table('upload_parts')
+    op.drop_index(op.f('ix_upload_sessions_expires_at'), table_name='upload_sessions')
+    op.drop_index(op.f('ix_upload_sessions_owner_id'), table_name='upload_sessions')
+    op.drop_table('upload_sessions')
@@ -0,0 +1,36 @@
+"""Add content-addressed blobs table
+
+Revision ID: a4d2b8e6f1c0
+Revises: 9c1f4e7a2b3d
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4d2b8e6f1c0'
+down_revision: Union[str, Sequence[str], None] = '9c1f4e7a2b3d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    op.create_table('blobs',
+        sa.Column('digest', sa.String(length=64), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=True),
+        sa.Column('refcount', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('digest')
+    )
+
+    # Existing rows keep blob_digest NULL and continue to own their file_path
+    op.add_column('files', sa.Column('blob_digest', sa.String(length=64), nullable=True))
+    op.create_foreign_key('fk_files_blob_digest', 'files', 'blobs', ['blob_digest'], ['digest'])
+    op.create_index(op.f('ix_files_blob_digest'), 'files', ['blob_digest'], unique=False)
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_files_blob_digest'), table_name='files')
+    op.drop_constraint('fk_files_blob_digest', 'files', type_='foreignkey')
+    op.drop_column('files', 'blob_digest')
+    op.drop_table('blobs')
@@ -0,0 +1,25 @@
+"""Index share expiry and file share lookups
+
+Revision ID: b7e3c9d1a5f2
+Revises: a4d2b8e6f1c0
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e3c9d1a5f2'
+down_revision: Union[str, Sequence[str], None] = 'a4d2b8e6f1c0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    # The expiry engine range-scans expires_at and bulk-deletes files by share_id
+    op.create_index(op.f('ix_shares_expires_at'), 'shares', ['expires_at'], unique=False)
+    op.create_index(op.f('ix_files_share_id'), 'files', ['share_id'], unique=False)
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_files_share_id'), table_name='files')
+    op.drop_index(op.f('ix_shares_expires_at'), table_name='shares')
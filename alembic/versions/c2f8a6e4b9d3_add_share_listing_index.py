@@ -0,0 +1,26 @@
+"""Add owner/created_at index for share listing
+
+Revision ID: c2f8a6e4b9d3
+Revises: b7e3c9d1a5f2
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2f8a6e4b9d3'
+down_revision: Union[str, Sequence[str], None] = 'b7e3c9d1a5f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    # The listing cursor is (created_at, id); a NULL created_at would fall out of every page
+    op.execute("UPDATE shares SET created_at = now() AT TIME ZONE 'utc' WHERE created_at IS NULL")
+    op.alter_column('shares', 'created_at', existing_type=sa.DateTime(), nullable=False)
+    op.create_index('ix_shares_owner_created', 'shares', ['owner_id', 'created_at', 'id'], unique=False)
+
+def downgrade() -> None:
+    op.drop_index('ix_shares_owner_created', table_name='shares')
+    op.alter_column('shares', 'created_at', existing_type=sa.DateTime(), nullable=True)
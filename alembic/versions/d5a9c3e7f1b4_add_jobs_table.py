@@ -0,0 +1,33 @@
+"""Add jobs table for the cluster-wide job runner
+
+Revision ID: d5a9c3e7f1b4
+Revises: c2f8a6e4b9d3
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5a9c3e7f1b4'
+down_revision: Union[str, Sequence[str], None] = 'c2f8a6e4b9d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    op.create_table('jobs',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('run_at', sa.DateTime(), nullable=False),
+        sa.Column('running_until', sa.DateTime(), nullable=True),
+        sa.Column('locked_by', sa.String(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('last_error', sa.String(), nullable=True),
+        sa.Column('last_started_at', sa.DateTime(), nullable=True),
+        sa.Column('last_finished_at', sa.DateTime(), nullable=True),
+        sa.Column('last_duration_ms', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+def downgrade() -> None:
+    op.drop_table('jobs')
@@ -0,0 +1,28 @@
+"""Add rate_limits table for the shared rate limiter
+
+Revision ID: e8b2d4f6a1c3
+Revises: d5a9c3e7f1b4
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8b2d4f6a1c3'
+down_revision: Union[str, Sequence[str], None] = 'd5a9c3e7f1b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    # UNLOGGED: losing the buckets in a crash only resets the limits, and writes skip the WAL
+    op.create_table('rate_limits',
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('full_at', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+        prefixes=['UNLOGGED']
+    )
+
+def downgrade() -> None:
+    op.drop_table('rate_limits')
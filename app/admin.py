@@ -0,0 +1,194 @@
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette_admin import action
+from starlette_admin.contrib.sqla import Admin, ModelView
+from starlette_admin.exceptions import FormValidationError
+from sqlalchemy import inspect, select
+from sqlalchemy.exc import IntegrityError
+import os
+import secrets
+
+from app.auth import get_password_hash
+from app.db import engine
+from app.models import User, FileRecord, Share, Blob
+from app.user_cache import user_cache
+from app.share_cache import notify_share_changed
+from app.revocations import revoke_downloads
+from app.blobs import ReleasedFiles, delete_released, release_files
+
+def previous_value(obj, attr: str):
+    """``obj.attr`` before the edit in progress: by before_edit, the form is already applied."""
+    history = inspect(obj).attrs[attr].history
+    return history.deleted[0] if history.deleted else getattr(obj, attr)
+
+def remember_released(request: Request, released: ReleasedFiles) -> None:
+    request.state.released = [*getattr(request.state, "released", []), released]
+
+async def delete_remembered(request: Request) -> None:
+    # Called once per deleted object after the commit; the first call removes the files of all of them
+    released, request.state.released = getattr(request.state, "released", []), []
+    for r in released:
+        await delete_released(r)
+
+class UserAdmin(ModelView):
+    identity = "user"
+    label = "Users"
+    icon = "fa fa-users"
+    column_list = ["id", "username", "is_active", "is_superuser", "must_change_password"]
+    exclude_fields_from_create = ["hashed_password", "must_change_password", "shares"]
+    exclude_fields_from_edit = ["hashed_password", "must_change_password", "shares"]
+    
+    async def before_create(self, request: Request, data: dict, obj: User) -> None:
+        otp = str(secrets.randbelow(900000) + 100000)
+        obj.hashed_password = await get_password_hash(otp)
+        obj.must_change_password = True
+        request.state.otp = otp
+
+    async def after_create(self, request: Request, obj: User) -> None:
+        otp = getattr(request.state, "otp", "Unknown")
+        # Set successAlert in session, which will be picked up by our base.html override
+        request.session["successAlert"] = f"User created successfully! Initial OTP: {otp}"
+
+    async def before_edit(self, request: Request, data: dict, obj: User) -> None:
+        # Remember the old name in case the edit renames the user
+        request.state.previous_username = previous_value(obj, "username")
+
+    # After the commit (DBSessionMiddleware commits once the view returns): invalidating
+    # earlier would let a concurrent request cache the old row again
+    async def after_edit_committed(self, request: Request, obj: User) -> None:
+        user_cache.invalidate(getattr(request.state, "previous_username", obj.username), obj.username)
+
+    async def after_delete_committed(self, request: Request, obj: User) -> None:
+        user_cache.invalidate(obj.username)
+
+    def handle_exception(self, exc: Exception) -> None:
+        if isinstance(exc, IntegrityError):
+            if "ix_users_username" in str(exc):
+                raise FormValidationError({"username": "Username already exists"})
+        raise exc
+
+    @action(
+        name="reset_password",
+        text="Reset Password",
+        confirmation="Are you sure you want to reset this user's password?",
+        submit_btn_text="Yes, reset",
+    )
+    async def reset_password_action(self, request: Request, pks: list) -> str:
+        db = request.state.session
+        messages = []
+        users = []
+        for pk in pks:
+            user = await self.find_by_pk(request, pk)
+            users.append(user)
+            otp = str(secrets.randbelow(900000) + 100000)
+            user.hashed_password = await get_password_hash(otp)
+            user.must_change_password = True
+            db.add(user)
+            messages.append(f"Password reset for {user.username}. New OTP: {otp}")
+        await db.commit()
+        user_cache.invalidate(*[user.username for user in users])
+        return " | ".join(messages)
+
+class ShareAdmin(ModelView):
+    identity = "share"
+    label = "Shares"
+    icon = "fa fa-share-alt"
+    column_list = ["id", "public_id", "owner", "created_at", "expires_at", "is_shared", "files"]
+    # Files come and go through uploads and deletes, which keep the blob refcounts right
+    exclude_fields_from_create = ["files"]
+    exclude_fields_from_edit = ["files"]
+
+    async def before_edit(self, request: Request, data: dict, obj: Share) -> None:
+        request.state.previous_public_id = previous_value(obj, "public_id")
+
+    async def after_edit(self, request: Request, obj: Share) -> None:
+        await self.publish_share_change(request, getattr(request.state, "previous_public_id", obj.public_id), obj.public_id)
+
+    async def before_delete(self, request: Request, obj: Share) -> None:
+        # The share's files go with it (cascade); remember what they referenced
+        result = await request.state.session.execute(
+            select(FileRecord.file_path, FileRecord.blob_digest).where(FileRecord.share_id == obj.id)
+        )
+        request.state.share_files = {**getattr(request.state, "share_files", {}), obj.id: result.all()}
+
+    async def after_delete(self, request: Request, obj: Share) -> None:
+        remember_released(request, await release_files(request.state.session, request.state.share_files.pop(obj.id, [])))
+        await self.publish_share_change(request, obj.public_id, deleted=True)
+
+    async def after_delete_committed(self, request: Request, obj: Share) -> None:
+        await delete_remembered(request)
+
+    async def publish_share_change(self, request: Request, *public_ids: str, deleted: bool = False) -> None:
+        # Part of the edit's transaction, which DBSessionMiddleware commits after these
+        # hooks: the notification goes out with that commit, or not at all
+        db = request.state.session
+        await notify_share_changed(db, *public_ids)
+        if deleted:
+            await revoke_downloads(db, share_ids=list(public_ids))
+
+class FileAdmin(ModelView):
+    identity = "file-record"
+    label = "Files"
+    icon = "fa fa-file"
+    column_list = ["id", "filename", "share_id", "blob"]
+    # Stored content is only ever referenced through uploads (see app.blobs)
+    exclude_fields_from_edit = ["file_path", "blob"]
+
+    def can_create(self, request: Request) -> bool:
+        return False
+
+    async def before_edit(self, request: Request, data: dict, obj: FileRecord) -> None:
+        # Still the old share: the foreign key follows a changed relationship on flush
+        request.state.previous_share_id = previous_value(obj, "share_id")
+
+    async def after_edit(self, request: Request, obj: FileRecord) -> None:
+        await self.publish_file_change(request, obj, getattr(request.state, "previous_share_id", obj.share_id), obj.share_id)
+
+    async def after_delete(self, request: Request, obj: FileRecord) -> None:
+        remember_released(request, await release_files(request.state.session, [obj]))
+        await self.publish_file_change(request, obj, obj.share_id)
+
+    async def after_delete_committed(self, request: Request, obj: FileRecord) -> None:
+        await delete_remembered(request)
+
+    async def publish_file_change(self, request: Request, obj: FileRecord, *share_ids: int) -> None:
+        # Cached listings of the shares the file was or is in, and its download links (which carry
+        # its name and storage key); sent with the admin's commit
+        db = request.state.session
+        result = await db.execute(select(Share.public_id).where(Share.id.in_(share_ids)))
+        await notify_share_changed(db, *result.scalars().all())
+        await revoke_downloads(db, file_ids=[obj.id])
+
+class BlobAdmin(ModelView):
+    identity = "blob"
+    label = "Blobs"
+    icon = "fa fa-database"
+    column_list = ["digest", "size", "refcount", "created_at"]
+
+    # Read-only: rows and refcounts are maintained by app.blobs, unreferenced blobs by its GC job
+    def can_create(self, request: Request) -> bool:
+        return False
+
+    def can_edit(self, request: Request) -> bool:
+        return False
+
+    def can_delete(self, request: Request) -> bool:
+        return False
+
+def create_admin_app() -> Starlette:
+    """Build the admin UI as a standalone ASGI app, for mounting at /admin."""
+    admin = Admin(
+        engine,
+        title="File Sharing Admin",
+        templates_dir="app/templates_admin",
+        # Shared by every worker, so CSRF tokens stay valid whichever worker serves the form
+        secret_key=os.getenv("SECRET_KEY", "secret-key-for-session"),
+    )
+    admin.add_view(UserAdmin(User))
+    admin.add_view(ShareAdmin(Share))
+    admin.add_view(FileAdmin(FileRecord))
+    admin.add_view(BlobAdmin(Blob))
+
+    holder = Starlette()
+    admin.mount_to(holder)
+    return holder.routes[0].app
@@ -1,30 +1,93 @@
+import asyncio
+import multiprocessing
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 
 from app.db import get_db
-from app.models import User
 from app.schemas import TokenData
+from app.user_cache import get_user_by_username
+from app.metrics import (
+    PASSWORD_HASH_IN_FLIGHT, PASSWORD_HASH_QUEUE_SECONDS, PASSWORD_HASH_REJECTED, PASSWORD_HASH_SECONDS
+)
+from app import passwords
 
 SECRET_KEY = os.getenv("SECRET_KEY", "secret")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt runs in these worker processes so it never blocks the event loop
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", min(2, os.cpu_count() or 1)))
+# Hash requests allowed to wait for a worker; beyond that they are rejected with 503
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", 32))
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+_password_pool: Optional[ProcessPoolExecutor] = None
+_password_in_flight = 0
+
+def _get_password_pool() -> ProcessPoolExecutor:
+    global _password_pool
+    if _password_pool is None:
+        # spawn, not fork: the parent has an event loop, DB connections and threads
+        _password_pool = ProcessPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _password_pool
+
+def shutdown_password_pool():
+    global _password_pool
+    if _password_pool is not None:
+        _password_pool.shutdown(wait=False, cancel_futures=True)
+        _password_pool = None
+
+async def _run_password_job(operation: str, func, *args):
+    global _password_in_flight, _password_pool
+    if _password_in_flight >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE:
+        PASSWORD_HASH_REJECTED.labels(operation).inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, please retry",
+            headers={"Retry-After": "1"},
+        )
+
+    _password_in_flight += 1
+    PASSWORD_HASH_IN_FLIGHT.inc()
+    submitted = time.perf_counter()
+    pool = _get_password_pool()
+    try:
+        loop = asyncio.get_running_loop()
+        result, elapsed = await loop.run_in_executor(pool, func, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed): stop the rest of it and start a fresh pool for the
+        # next caller, unless a concurrent caller that hit the same failure already did
+        pool.shutdown(wait=False, cancel_futures=True)
+        if _password_pool is pool:
+            _password_pool = None
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, please retry",
+            headers={"Retry-After": "1"},
+        )
+    finally:
+        _password_in_flight -= 1
+        PASSWORD_HASH_IN_FLIGHT.dec()
+    PASSWORD_HASH_SECONDS.labels(operation).observe(elapsed)
+    PASSWORD_HASH_QUEUE_SECONDS.labels(operation).observe(max(time.perf_counter() - submitted - elapsed, 0))
+    return result
+
+async def verify_password(plain_password, hashed_password) -> bool:
+    return await _run_password_job("verify", passwords.check_password, plain_password, hashed_password)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password) -> str:
+    return await _run_password_job("hash", passwords.hash_password, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -51,8 +114,9 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
     except JWTError:
         raise credentials_exception
     
-    result = await db.execute(select(User).where(User.username == token_data.username))
-    user = result.scalars().first()
+    user = await get_user_by_username(db, token_data.username)
     if user is None:
         raise credentials_exception
+    # Commits of this request's session count as the user's writes (read-your-writes, app/replica.py)
+    db.info["user_id"] = user.id
     return user
@@ -0,0 +1,143 @@
+import os
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import select, update, delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app.db import AsyncSessionLocal
+from app.models import Blob, FileRecord, Share
+from app.storage import record_key, storage
+from app.uploads import IngestedFile
+
+def remove_files(paths: Iterable[str]):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error deleting file {path}: {e}")
+
+# Content-addressed store: every distinct upload is kept once, keyed by its SHA-256
+async def _place_blob(temp_path: str, digest: str, new_blob: bool):
+    if new_blob or not await storage.exists(digest):
+        await storage.put(digest, temp_path)
+    else:
+        await run_in_threadpool(os.remove, temp_path)
+
+async def acquire_blobs(db: AsyncSession, files: List[IngestedFile]):
+    """Take a reference on the blob for every ingested file, moving the
+    temporary upload into the store if the content is new.
+
+    The blob row stays locked until the caller commits, so a concurrent
+    release of the same digest cannot unlink the file underneath us. On
+    failure call ``discard_ingest`` before the transaction is rolled back.
+    """
+    for f in files:
+        result = await db.execute(
+            insert(Blob)
+            .values(digest=f.digest, size=f.size, refcount=1)
+            .on_conflict_do_update(index_elements=[Blob.digest], set_={"refcount": Blob.refcount + 1})
+            .returning(Blob.refcount)
+        )
+        f.new_blob = result.scalar() == 1
+        await _place_blob(f.file_path, f.digest, f.new_blob)
+        f.placed = True
+
+async def discard_ingest(db: AsyncSession, files: List[IngestedFile]):
+    """Undo ``acquire_blobs`` for a request that failed: drop temporary files
+    and blobs this request created, then roll back."""
+    await run_in_threadpool(remove_files, [f.file_path for f in files if not f.placed])
+    await storage.delete_many(f.digest for f in files if f.placed and f.new_blob)
+    await db.rollback()
+
+async def owned_digests(db: AsyncSession, digests: List[str], owner_id: int) -> List[str]:
+    """The ``digests`` that ``owner_id`` already references through one of their
+    own files. Only these may be attached by hash: knowing a digest is not
+    proof of having the content."""
+    result = await db.execute(
+        select(FileRecord.blob_digest)
+        .join(Share, FileRecord.share_id == Share.id)
+        .where(Share.owner_id == owner_id, FileRecord.blob_digest.in_(digests))
+        .distinct()
+    )
+    return list(result.scalars().all())
+
+async def attach_blobs(db: AsyncSession, digests: List[str], owner_id: int) -> List[Blob]:
+    """Take an extra reference on blobs ``owner_id`` already has (see
+    ``owned_digests``). Raises KeyError with the first other digest."""
+    owned = set(await owned_digests(db, digests, owner_id))
+    blobs = []
+    for digest in digests:
+        if digest not in owned:
+            raise KeyError(digest)
+        result = await db.execute(
+            update(Blob)
+            .where(Blob.digest == digest, Blob.refcount > 0)
+            .values(refcount=Blob.refcount + 1)
+            .returning(Blob)
+        )
+        blob = result.scalars().first()
+        if blob is None:
+            raise KeyError(digest)
+        blobs.append(blob)
+    return blobs
+
+async def release_blobs(db: AsyncSession, digests: Iterable[str]) -> Dict[str, int]:
+    """Drop one reference per entry in ``digests``; returns digest -> size for
+    the blobs whose last reference went away. Their rows stay (with refcount 0,
+    locked until the caller commits) until ``purge_unreferenced_blobs``."""
+    counts = Counter(digests)
+    if not counts:
+        return {}
+    for digest, n in counts.items():
+        await db.execute(update(Blob).where(Blob.digest == digest).values(refcount=Blob.refcount - n))
+    result = await db.execute(
+        select(Blob.digest, Blob.size).where(Blob.digest.in_(list(counts)), Blob.refcount <= 0)
+    )
+    return {digest: size for digest, size in result.all()}
+
+@dataclass
+class ReleasedFiles:
+    """Storage left unreferenced by ``release_files``; removed by ``delete_released``."""
+    legacy_keys: List[str]
+    digests: List[str]
+    bytes_freed: int
+
+async def release_files(db: AsyncSession, records: Iterable[FileRecord]) -> ReleasedFiles:
+    """Release the storage behind FileRecords (or rows with their
+    ``file_path`` and ``blob_digest``) that are being deleted in the current
+    transaction. Call after the rows are deleted and flushed, before commit,
+    and pass the result to ``delete_released`` once the commit succeeded:
+    until then a rollback must still find every file in place."""
+    records = list(records)
+    legacy_keys = [record_key(r) for r in records if not r.blob_digest and r.file_path]
+    unreferenced = await release_blobs(db, [r.blob_digest for r in records if r.blob_digest])
+    return ReleasedFiles(legacy_keys, list(unreferenced), sum(unreferenced.values()))
+
+async def purge_unreferenced_blobs(db: AsyncSession, digests: Optional[List[str]] = None) -> int:
+    """Delete blobs without references (all of them, or those among ``digests``)
+    along with their files, and commit. Returns the number of blobs."""
+    query = delete(Blob).where(Blob.refcount <= 0)
+    if digests is not None:
+        query = query.where(Blob.digest.in_(digests))
+    result = await db.execute(query.returning(Blob.digest))
+    unreferenced = list(result.scalars().all())
+    # Unlinked while the deleted rows are still locked: an upload of the same content
+    # waits for the commit and then stores its file afresh
+    await storage.delete_many(unreferenced)
+    await db.commit()
+    return len(unreferenced)
+
+async def delete_released(released: ReleasedFiles):
+    """Remove the files of ``release_files`` after its transaction committed.
+    Blobs referenced again in the meantime are kept; blobs left behind by a
+    crash before this point are collected by the blob GC job."""
+    await storage.delete_many(released.legacy_keys)
+    if released.digests:
+        async with AsyncSessionLocal() as db:
+            await purge_unreferenced_blobs(db, released.digests)
@@ -1,16 +1,119 @@
+import asyncio
 import os
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from dotenv import load_dotenv
 
+from app.metrics import (
+    DB_POOL_CAPACITY, DB_POOL_CHECKOUT_SECONDS, DB_POOL_CONNECTS, DB_POOL_IN_USE, DB_POOL_TIMEOUTS
+)
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Streaming replica (or the primary under a second URL) used by read-only endpoints; empty = primary only
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+
+# Log every SQL statement (development only)
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+# Connections kept open per worker, and extra ones allowed under load (closed again when returned)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+# Seconds a request waits for a free connection before failing
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+# Reopen connections older than this many seconds (-1 = never), e.g. below a proxy's idle timeout
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+# Test each connection on checkout, so ones dropped by the server are replaced transparently
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Prepared statements cached per connection; 0 behind pgbouncer in transaction mode
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+# Connections opened per worker at startup, so the first requests don't pay for the handshake
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", DB_POOL_SIZE))
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that reports how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+
+def create_engine(url: str) -> AsyncEngine:
+    engine = create_async_engine(
+        url,
+        echo=DB_ECHO,
+        poolclass=InstrumentedPool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args={
+            # SQLAlchemy's own cache of asyncpg prepared statements, and asyncpg's cache for its direct queries
+            "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        },
+    )
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _connection_opened(dbapi_connection, connection_record):
+        DB_POOL_CONNECTS.inc()
+
+    @event.listens_for(engine.sync_engine, "checkout")
+    def _connection_checked_out(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_IN_USE.inc()
+
+    @event.listens_for(engine.sync_engine, "checkin")
+    def _connection_checked_in(dbapi_connection, connection_record):
+        DB_POOL_IN_USE.dec()
+
+    return engine
+
+engine = create_engine(DATABASE_URL)
+# Optional replica for read-only endpoints; routing and fallback live in app/replica.py
+read_engine = create_engine(DATABASE_READ_URL) if DATABASE_READ_URL else None
+
+async def _warm_up(target: AsyncEngine, count: int):
+    started = time.perf_counter()
+    connections = await asyncio.gather(*(target.connect() for _ in range(count)), return_exceptions=True)
+    errors = [c for c in connections if isinstance(c, BaseException)]
+    for connection in connections:
+        if not isinstance(connection, BaseException):
+            await connection.close()
+    name = "replica" if target is read_engine else "primary"
+    if errors:
+        print(f"Database pool warmup ({name}): {len(errors)} of {count} connections failed: {errors[0]}")
+    else:
+        print(f"Database pool ({name}) warmed up with {count} connections in {time.perf_counter() - started:.2f}s")
+
+async def warm_up_pool(count: int = DB_POOL_WARMUP):
+    """Report this worker's pool capacity, then open ``count`` connections (at most
+    the pool size) per engine and return them to the pool. Call once per worker
+    process at startup."""
+    # Not at import: app/serve.py imports the app before forking, and prometheus_client
+    # resets multiprocess values in a process with a new pid
+    for e in (engine, read_engine):
+        if e is not None:
+            DB_POOL_CAPACITY.inc(DB_POOL_SIZE + DB_MAX_OVERFLOW)
+    count = min(count, DB_POOL_SIZE)
+    if count <= 0:
+        return
+    await asyncio.gather(*(_warm_up(e, count) for e in (engine, read_engine) if e is not None))
 
-engine = create_async_engine(DATABASE_URL, echo=True)
 AsyncSessionLocal = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
+ReadSessionLocal = sessionmaker(
+    read_engine, class_=AsyncSession, expire_on_commit=False
+) if read_engine is not None else None
 
 Base = declarative_base()
 
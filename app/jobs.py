@@ -0,0 +1,266 @@
+import asyncio
+import os
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import case, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app.db import AsyncSessionLocal, engine
+from app.metrics import JOB_LEADER, JOB_RUN_SECONDS, JOB_RUNS
+from app.models import Job
+from app.notify import publish, subscribe
+
+# Longest a worker goes without checking for due jobs; normally the leader's NOTIFY wakes it first
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", 60))
+# A running job's lease; renewed every third of it, so only a dead worker lets it lapse
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", 300))
+# Retry delay after a failure, doubled per consecutive failure up to the maximum
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", 10))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", 600))
+# Postgres advisory lock key held by the scheduler leader
+JOB_LEADER_LOCK_ID = int(os.getenv("JOB_LEADER_LOCK_ID", 7246531))
+
+JOB_CHANNEL = "jobs"
+
+_LEADER_RETRY_SECONDS = 15
+
+JobHandler = Callable[[datetime], Awaitable[Optional[datetime]]]
+
+
+class _RegisteredJob:
+    def __init__(self, handler: JobHandler, every: float):
+        self.handler = handler
+        self.every = every
+
+
+_jobs: Dict[str, _RegisteredJob] = {}
+_hints: Dict[str, datetime] = {}
+_runner_wakeup = asyncio.Event()
+_leader_wakeup = asyncio.Event()
+
+# A running job is due again only once its lease has lapsed
+_due_at = func.greatest(Job.run_at, func.coalesce(Job.running_until, Job.run_at))
+
+
+def register_job(name: str, handler: JobHandler, every: float):
+    """Run ``await handler(now)`` about every ``every`` seconds, on one worker of
+    the whole deployment at a time. The handler may return when it should run
+    next instead; exceptions are retried with backoff."""
+    _jobs[name] = _RegisteredJob(handler, every)
+
+
+def run_job_soon(name: str, at: datetime):
+    """Make job ``name`` due no later than ``at`` (naive UTC) on every worker.
+    Safe to call from request handlers: the change is written by this worker's
+    runner in the background."""
+    if name in _hints and _hints[name] <= at:
+        return
+    _hints[name] = at
+    _runner_wakeup.set()
+
+
+def _worker_id() -> str:
+    # Not a module constant: pre-forked workers (app/serve.py) share the parent's import
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _on_message(items):
+    # "due": the leader saw a job become due; "changed": the schedule moved
+    if "due" in items:
+        _runner_wakeup.set()
+    if "changed" in items:
+        _leader_wakeup.set()
+
+
+async def _apply_hints():
+    hints = dict(_hints)
+    async with AsyncSessionLocal() as db:
+        for name, at in hints.items():
+            # A running job takes the hint into account when it reschedules itself
+            await db.execute(
+                update(Job)
+                .where(Job.name == name, or_(Job.run_at > at, Job.running_until.isnot(None)))
+                .values(run_at=at)
+            )
+        await publish(db, JOB_CHANNEL, "changed")
+        await db.commit()
+    for name, at in hints.items():
+        if _hints.get(name) == at:
+            del _hints[name]
+
+
+async def _claim(now: datetime) -> Optional[Job]:
+    async with AsyncSessionLocal() as db:
+        # SKIP LOCKED: workers claiming at the same moment each get a different job, or none
+        result = await db.execute(
+            select(Job)
+            .where(Job.name.in_(list(_jobs)), _due_at <= now)
+            .order_by(Job.run_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        job = result.scalars().first()
+        if job is None:
+            return None
+        job.running_until = now + timedelta(seconds=JOB_LEASE_SECONDS)
+        job.locked_by = _worker_id()
+        job.last_started_at = now
+        await publish(db, JOB_CHANNEL, "changed")
+        await db.commit()
+        return job
+
+
+async def _renew_lease(name: str):
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(Job)
+                    .where(Job.name == name, Job.locked_by == _worker_id())
+                    .values(running_until=datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS))
+                )
+                await db.commit()
+        except Exception as e:
+            print(f"Error renewing lease of job {name}: {e}")
+
+
+async def _finish(name: str, values: dict):
+    async with AsyncSessionLocal() as db:
+        # Only if the lease is still ours; a job taken over by another worker is theirs to reschedule
+        await db.execute(
+            update(Job)
+            .where(Job.name == name, Job.locked_by == _worker_id())
+            .values(running_until=None, locked_by=None, **values)
+        )
+        await publish(db, JOB_CHANNEL, "changed")
+        await db.commit()
+
+
+async def _run(job: Job):
+    registered = _jobs[job.name]
+    lease = asyncio.create_task(_renew_lease(job.name))
+    started = time.perf_counter()
+    try:
+        next_run = await registered.handler(job.last_started_at)
+    except asyncio.CancelledError:
+        # Shutting down; hand the job back instead of leaving it to the lease
+        try:
+            await _finish(job.name, {})
+        except Exception:
+            pass
+        raise
+    except Exception as e:
+        duration = time.perf_counter() - started
+        JOB_RUN_SECONDS.labels(job.name).observe(duration)
+        JOB_RUNS.labels(job.name, "failure").inc()
+        delay = min(JOB_RETRY_BASE_SECONDS * 2 ** job.attempts, JOB_RETRY_MAX_SECONDS)
+        print(f"Job {job.name} failed (attempt {job.attempts + 1}), retrying in {delay:.0f}s: {e}")
+        traceback.print_exc()
+        await _finish(job.name, {
+            "run_at": datetime.utcnow() + timedelta(seconds=delay),
+            "attempts": job.attempts + 1,
+            "last_error": f"{type(e).__name__}: {e}"[:1000],
+            "last_finished_at": datetime.utcnow(),
+            "last_duration_ms": int(duration * 1000),
+        })
+        return
+    finally:
+        lease.cancel()
+
+    duration = time.perf_counter() - started
+    JOB_RUN_SECONDS.labels(job.name).observe(duration)
+    JOB_RUNS.labels(job.name, "success").inc()
+    if next_run is None:
+        next_run = datetime.utcnow() + timedelta(seconds=registered.every)
+    await _finish(job.name, {
+        # run_at only differs from the claimed value if run_job_soon() moved it meanwhile
+        "run_at": case((Job.run_at != job.run_at, func.least(Job.run_at, next_run)), else_=next_run),
+        "attempts": 0,
+        "last_error": None,
+        "last_finished_at": datetime.utcnow(),
+        "last_duration_ms": int(duration * 1000),
+    })
+
+
+async def run_jobs():
+    """Claim and run due jobs on this worker, one at a time; runs for the app's lifetime."""
+    while True:
+        _runner_wakeup.clear()
+        try:
+            if _hints:
+                await _apply_hints()
+            while True:
+                job = await _claim(datetime.utcnow())
+                if job is None:
+                    break
+                await _run(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error in job runner: {e}")
+            traceback.print_exc()
+        try:
+            await asyncio.wait_for(_runner_wakeup.wait(), JOB_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def _lead(connection):
+    now = datetime.utcnow()
+    if _jobs:
+        await connection.execute(
+            insert(Job).values([{"name": name, "run_at": now} for name in _jobs]).on_conflict_do_nothing()
+        )
+    while True:
+        _leader_wakeup.clear()
+        now = datetime.utcnow()
+        next_due = await connection.scalar(select(func.min(_due_at)).where(Job.name.in_(list(_jobs))))
+        if next_due is not None and next_due <= now:
+            await connection.execute(select(func.pg_notify(JOB_CHANNEL, "due")))
+            _runner_wakeup.set()
+            timeout = JOB_POLL_SECONDS
+        elif next_due is not None:
+            timeout = min((next_due - now).total_seconds(), JOB_POLL_SECONDS)
+        else:
+            timeout = JOB_POLL_SECONDS
+        try:
+            await asyncio.wait_for(_leader_wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def lead_jobs():
+    """Compete for the scheduler role; the leader seeds job rows and tells every
+    worker when a job is due. Runs for the app's lifetime.
+
+    Leadership only decides who sends the wake-ups: claiming a job is what makes
+    it run once, so a second leader (e.g. during a network split) costs nothing
+    but duplicate notifications.
+    """
+    while True:
+        try:
+            async with engine.connect() as connection:
+                # No open transaction while leading; the advisory lock belongs to the session
+                connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+                if await connection.scalar(select(func.pg_try_advisory_lock(JOB_LEADER_LOCK_ID))):
+                    JOB_LEADER.set(1)
+                    print(f"Worker {_worker_id()} is now the job scheduler")
+                    try:
+                        await _lead(connection)
+                    finally:
+                        JOB_LEADER.set(0)
+                        # Never return a connection holding the lock to the pool
+                        await connection.invalidate()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error in job scheduler: {e}")
+        await asyncio.sleep(_LEADER_RETRY_SECONDS)
+
+
+subscribe(JOB_CHANNEL, _on_message)
@@ -1,34 +1,200 @@
 import os
 import json
+import atexit
+import fcntl
+import gzip
+import queue
+import shutil
+import threading
+import time
+from collections import defaultdict
 from datetime import datetime
+from typing import Dict, List, Optional
 from fastapi import Request
 
+from app.metrics import LOG_BATCH_SIZE, LOG_DROPPED, LOG_QUEUE_DEPTH, LOG_WRITTEN
+
 LOGS_DIR = "logs"
 
+# Entries waiting for the writer thread; when it is full, new entries are dropped (and counted)
+# rather than waited for, since log_event runs on the event loop
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+# Queued entries are written at least this often, and in batches of at most LOG_MAX_BATCH
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", 0.5))
+LOG_MAX_BATCH = int(os.getenv("LOG_MAX_BATCH", 1000))
+
+# never: leave it to the OS; batch: fsync after every batch; interval: at most every LOG_FSYNC_INTERVAL seconds
+LOG_FSYNC = os.getenv("LOG_FSYNC", "interval")
+LOG_FSYNC_INTERVAL = float(os.getenv("LOG_FSYNC_INTERVAL", 5))
+
+# A log file is rotated (renamed with a timestamp and gzipped) once it reaches LOG_ROTATE_BYTES,
+# and at every LOG_ROTATE_SECONDS boundary (86400 = midnight UTC); 0 disables either
+LOG_ROTATE_BYTES = int(os.getenv("LOG_ROTATE_BYTES", 100 * 1024 * 1024))
+LOG_ROTATE_SECONDS = int(os.getenv("LOG_ROTATE_SECONDS", 24 * 3600))
+
 def get_real_ip(request: Request) -> str:
-    # Cloudflare header
-    cf_ip = request.headers.get("CF-Connecting-IP")
-    if cf_ip:
-        return cf_ip
-    
-    # Standard proxy header
-    x_forwarded_for = request.headers.get("X-Forwarded-For")
-    if x_forwarded_for:
-        return x_forwarded_for.split(",")[0].strip()
-        
-    # Fallback to direct client address
+    # Forwarding headers are not read here: any client can set them. Behind a proxy listed in
+    # FORWARDED_ALLOW_IPS, uvicorn (proxy_headers) has already replaced the peer address with
+    # the rightmost X-Forwarded-For hop that is not a trusted proxy
     return request.client.host if request.client else "unknown"
 
+def _rotation_period(timestamp: float) -> int:
+    return int(timestamp // LOG_ROTATE_SECONDS) if LOG_ROTATE_SECONDS else 0
+
+def _compress(path: str):
+    try:
+        with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dest:
+            shutil.copyfileobj(src, dest, 1024 * 1024)
+        os.remove(path)
+    except Exception as e:
+        print(f"Error compressing log file {path}: {e}")
+
+class _LogFile:
+    """One open ``<event_type>.log``. Several worker processes may append to
+    the same file; rotation takes a lock file and every writer reopens once
+    it notices the path now points at a new inode."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fh = None
+        self.inode = None
+        self.size = 0
+        self.period = 0
+        self.last_fsync = time.monotonic()
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.fh = open(self.path, "ab")
+        stat_result = os.fstat(self.fh.fileno())
+        self.inode = stat_result.st_ino
+        self.size = stat_result.st_size
+        self.period = _rotation_period(stat_result.st_mtime if self.size else time.time())
+
+    def close(self):
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+
+    def _moved(self) -> bool:
+        try:
+            return os.stat(self.path).st_ino != self.inode
+        except FileNotFoundError:
+            return True
+
+    def write(self, data: bytes):
+        if self.fh is None or self._moved():
+            self.close()
+            self.open()
+        if self.size and _rotation_period(time.time()) != self.period:
+            self.rotate()
+        # One write per batch; with O_APPEND concurrent writers never interleave inside it
+        self.fh.write(data)
+        self.fh.flush()
+        self.size += len(data)
+
+        now = time.monotonic()
+        if LOG_FSYNC == "batch" or (LOG_FSYNC == "interval" and now - self.last_fsync >= LOG_FSYNC_INTERVAL):
+            os.fsync(self.fh.fileno())
+            self.last_fsync = now
+
+        if LOG_ROTATE_BYTES and self.size >= LOG_ROTATE_BYTES:
+            self.rotate()
+
+    def rotate(self):
+        with open(self.path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another process may have rotated already; then just follow it to the new file
+            if not self._moved():
+                rotated = f"{self.path}.{datetime.utcnow().strftime('%Y%m%d-%H%M%S-%f')}"
+                os.rename(self.path, rotated)
+                threading.Thread(target=_compress, args=(rotated,), daemon=True).start()
+        self.close()
+        self.open()
+
+class _LogWriter:
+    """Background thread that drains the queue and appends batches per event type."""
+
+    def __init__(self):
+        self.queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self.files: Dict[str, _LogFile] = {}
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, event_type: str, line: str):
+        try:
+            self.queue.put_nowait((event_type, line))
+        except queue.Full:
+            LOG_DROPPED.labels(event_type).inc()
+
+    def _run(self):
+        running = True
+        while running:
+            batch: List[tuple] = []
+            try:
+                item = self.queue.get(timeout=LOG_FLUSH_INTERVAL)
+                while item is not None:
+                    batch.append(item)
+                    if len(batch) >= LOG_MAX_BATCH:
+                        break
+                    item = self.queue.get_nowait()
+                running = item is not None or len(batch) >= LOG_MAX_BATCH
+            except queue.Empty:
+                pass
+            LOG_QUEUE_DEPTH.set(self.queue.qsize())
+            if batch:
+                self._write(batch)
+        for log_file in self.files.values():
+            log_file.close()
+
+    def _write(self, batch: List[tuple]):
+        by_type = defaultdict(list)
+        for event_type, line in batch:
+            by_type[event_type].append(line)
+        for event_type, lines in by_type.items():
+            log_file = self.files.get(event_type)
+            if log_file is None:
+                log_file = self.files[event_type] = _LogFile(os.path.join(LOGS_DIR, f"{event_type}.log"))
+            try:
+                log_file.write("".join(lines).encode())
+                LOG_WRITTEN.labels(event_type).inc(len(lines))
+                LOG_BATCH_SIZE.observe(len(lines))
+            except Exception as e:
+                LOG_DROPPED.labels(event_type).inc(len(lines))
+                print(f"Error writing {event_type} log: {e}")
+                log_file.close()
+
+    def stop(self):
+        # Sentinel goes in behind everything already queued, so those entries are written first
+        self.queue.put(None)
+        self.thread.join(timeout=10)
+
+_writer: Optional[_LogWriter] = None
+_writer_lock = threading.Lock()
+
+def _get_writer() -> _LogWriter:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = _LogWriter()
+    return _writer
+
+def stop_log_writer():
+    """Flush queued entries and close log files (app shutdown)."""
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.stop()
+            _writer = None
+
+atexit.register(stop_log_writer)
+
 def log_event(event_type: str, details: dict, request: Request):
-    os.makedirs(LOGS_DIR, exist_ok=True)
-    
-    log_file = os.path.join(LOGS_DIR, f"{event_type}.log")
-    
     log_entry = {
         "timestamp": datetime.utcnow().isoformat(),
         "ip": get_real_ip(request),
         "details": details
     }
-    
-    with open(log_file, "a") as f:
-        f.write(json.dumps(log_entry) + "\n")
+
+    _get_writer().submit(event_type, json.dumps(log_entry) + "\n")
@@ -0,0 +1,276 @@
+import os
+import time
+from typing import Iterator, Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# With several workers, set PROMETHEUS_MULTIPROC_DIR to an empty directory shared by all of
+# them (before start); every worker then reports the combined numbers. Gauges say how to combine.
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "cloudvault_http_request_seconds",
+    "Time until the response starts, by route template",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+
+TRANSFER_BYTES = Counter(
+    "cloudvault_transfer_bytes_total",
+    "File bytes received (upload) or sent (download) through the app",
+    ["direction"],
+)
+TRANSFER_THROUGHPUT = Histogram(
+    "cloudvault_transfer_throughput_bytes_per_second",
+    "Average throughput of each finished upload or download",
+    ["direction"],
+    buckets=(64e3, 256e3, 1e6, 4e6, 16e6, 64e6, 256e6, 1e9),
+)
+TRANSFERS_ACTIVE = Gauge(
+    "cloudvault_transfers_active",
+    "Uploads and downloads in progress",
+    ["direction"],
+    multiprocess_mode="livesum",
+)
+
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "cloudvault_db_pool_checkout_seconds",
+    "Time spent waiting for a connection from the SQLAlchemy pool",
+    buckets=(0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+DB_POOL_IN_USE = Gauge(
+    "cloudvault_db_pool_connections_in_use",
+    "Connections checked out of the SQLAlchemy pool",
+    multiprocess_mode="livesum",
+)
+DB_POOL_CAPACITY = Gauge(
+    "cloudvault_db_pool_capacity_connections",
+    "Most connections the SQLAlchemy pool hands out (pool size + overflow); in use / capacity is saturation",
+    multiprocess_mode="livesum",
+)
+DB_POOL_TIMEOUTS = Counter(
+    "cloudvault_db_pool_timeouts_total",
+    "Checkouts that gave up after DB_POOL_TIMEOUT because the pool was exhausted",
+)
+DB_POOL_CONNECTS = Counter(
+    "cloudvault_db_pool_connects_total",
+    "New database connections opened by the pool (startup, overflow, recycling, reconnects)",
+)
+DB_REPLICA_LAG_SECONDS = Gauge(
+    "cloudvault_db_replica_lag_seconds",
+    "Replication lag of the read replica at the last check (0 when caught up)",
+    multiprocess_mode="mostrecent",
+)
+DB_REPLICA_USABLE = Gauge(
+    "cloudvault_db_replica_usable",
+    "1 while the read replica is reachable and within REPLICA_MAX_LAG_SECONDS",
+    multiprocess_mode="mostrecent",
+)
+DB_READ_ROUTES = Counter(
+    "cloudvault_db_read_routes_total",
+    "Sessions handed to read-only endpoints, by target and why",
+    ["target", "reason"],
+)
+
+EXPIRY_BACKLOG = Gauge(
+    "cloudvault_expiry_backlog_shares",
+    "Expired shares not yet deleted, as of the last expiry run",
+    multiprocess_mode="mostrecent",
+)
+EXPIRY_RECLAIMED_SHARES = Counter(
+    "cloudvault_expiry_reclaimed_shares_total",
+    "Expired shares deleted by the expiry engine",
+)
+EXPIRY_RECLAIMED_FILES = Counter(
+    "cloudvault_expiry_reclaimed_files_total",
+    "File records deleted along with expired shares",
+)
+EXPIRY_RECLAIMED_BYTES = Counter(
+    "cloudvault_expiry_reclaimed_bytes_total",
+    "Bytes of blob storage freed by the expiry engine",
+)
+
+JOB_RUN_SECONDS = Histogram(
+    "cloudvault_job_run_seconds",
+    "Duration of each background job run",
+    ["job"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0),
+)
+JOB_RUNS = Counter(
+    "cloudvault_job_runs_total",
+    "Background job runs by outcome",
+    ["job", "result"],
+)
+JOB_LEADER = Gauge(
+    "cloudvault_job_leader",
+    "1 while this worker is the job scheduler (summed: leaders in this deployment)",
+    multiprocess_mode="livesum",
+)
+
+USER_CACHE_HITS = Counter(
+    "cloudvault_user_cache_hits_total",
+    "Authenticated requests whose user was served from the in-process cache",
+)
+USER_CACHE_MISSES = Counter(
+    "cloudvault_user_cache_misses_total",
+    "Authenticated requests that had to load their user from the database",
+)
+
+SHARE_CACHE_HITS = Counter(
+    "cloudvault_share_cache_hits_total",
+    "Public share lookups answered from the in-process cache",
+    ["result"],
+)
+SHARE_CACHE_MISSES = Counter(
+    "cloudvault_share_cache_misses_total",
+    "Public share lookups that had to query the database",
+)
+SHARE_CACHE_NOTIFICATIONS = Counter(
+    "cloudvault_share_cache_notifications_total",
+    "Share invalidation messages applied (from this worker or via LISTEN/NOTIFY)",
+)
+
+DOWNLOAD_TOKEN_LOOKUPS = Counter(
+    "cloudvault_download_token_lookups_total",
+    "File downloads by how the token was resolved",
+    ["result"],
+)
+
+PASSWORD_HASH_SECONDS = Histogram(
+    "cloudvault_password_hash_seconds",
+    "bcrypt time inside a password pool worker",
+    ["operation"],
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0),
+)
+PASSWORD_HASH_QUEUE_SECONDS = Histogram(
+    "cloudvault_password_hash_queue_seconds",
+    "Time a password job waited for a free worker (includes IPC overhead)",
+    ["operation"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+PASSWORD_HASH_IN_FLIGHT = Gauge(
+    "cloudvault_password_hash_in_flight",
+    "Password jobs running or queued in the password pool",
+    multiprocess_mode="livesum",
+)
+PASSWORD_HASH_REJECTED = Counter(
+    "cloudvault_password_hash_rejected_total",
+    "Password jobs refused with 503 because the pool queue was full",
+    ["operation"],
+)
+RATE_LIMITED = Counter(
+    "cloudvault_rate_limited_total",
+    "Requests refused with 429 by a per-IP rate limit, by budget",
+    ["budget"],
+)
+RATE_LIMIT_ERRORS = Counter(
+    "cloudvault_rate_limit_errors_total",
+    "Rate limit checks that failed (shared backend unreachable) and let the request through",
+)
+
+LOG_WRITTEN = Counter(
+    "cloudvault_log_events_written_total",
+    "Event log entries written to disk",
+    ["event_type"],
+)
+LOG_DROPPED = Counter(
+    "cloudvault_log_events_dropped_total",
+    "Event log entries discarded because the queue was full or the write failed",
+    ["event_type"],
+)
+LOG_QUEUE_DEPTH = Gauge(
+    "cloudvault_log_queue_depth",
+    "Event log entries waiting for the writer thread",
+    multiprocess_mode="livesum",
+)
+LOG_BATCH_SIZE = Histogram(
+    "cloudvault_log_batch_size",
+    "Entries appended per write",
+    buckets=(1, 5, 10, 50, 100, 500, 1000),
+)
+
+
+class Transfer:
+    """Accounts one upload or download: active gauge, byte counter and, at the end, throughput."""
+
+    def __init__(self, direction: str):
+        self.direction = direction
+        self.bytes = 0
+        self.started = 0.0
+
+    def __enter__(self) -> "Transfer":
+        self.started = time.perf_counter()
+        TRANSFERS_ACTIVE.labels(self.direction).inc()
+        return self
+
+    def add(self, size: int):
+        self.bytes += size
+        TRANSFER_BYTES.labels(self.direction).inc(size)
+
+    def __exit__(self, *exc_info):
+        TRANSFERS_ACTIVE.labels(self.direction).dec()
+        elapsed = time.perf_counter() - self.started
+        if self.bytes and elapsed > 0:
+            TRANSFER_THROUGHPUT.labels(self.direction).observe(self.bytes / elapsed)
+
+
+def count_download(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    with Transfer("download") as transfer:
+        for chunk in chunks:
+            transfer.add(len(chunk))
+            yield chunk
+
+
+class RequestMetricsMiddleware:
+    """Observes HTTP_REQUEST_SECONDS for every request, up to the start of the response."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        observed = False
+
+        def observe(status: int):
+            nonlocal observed
+            if observed:
+                return
+            observed = True
+            # Route template rather than the raw path, so labels stay bounded
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                scope["method"], getattr(route, "path", "unmatched"), f"{status // 100}xx"
+            ).observe(time.perf_counter() - started)
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            observe(500)
+
+
+def metrics_response() -> Response:
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def mark_worker_dead(pid: Optional[int] = None):
+    """Drop a worker's live gauges from the shared metrics directory: this one's
+    at shutdown, or another's once it has died (see app/serve.py)."""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(pid or os.getpid())
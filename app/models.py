@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, Float, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.db import Base
 
@@ -27,11 +27,24 @@ class Share(Base):
     
     files = relationship("FileRecord", back_populates="share", cascade="all, delete-orphan")
     
-    created_at = Column(DateTime, default=datetime.utcnow)
-    expires_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=True, index=True)
     password_hash = Column(String, nullable=True)
     is_shared = Column(Boolean, default=True)
 
+    # Keyset pagination of GET /shares
+    __table_args__ = (Index("ix_shares_owner_created", "owner_id", "created_at", "id"),)
+
+class Blob(Base):
+    __tablename__ = "blobs"
+
+    # Hex SHA-256 of the content; the blob is stored under this name
+    digest = Column(String(64), primary_key=True)
+    size = Column(BigInteger)
+    # Number of FileRecords pointing at this blob; the file is unlinked when it drops to zero
+    refcount = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class FileRecord(Base):
     __tablename__ = "files"
 
@@ -39,5 +52,59 @@ class FileRecord(Base):
     filename = Column(String)
     file_path = Column(String)
     
-    share_id = Column(Integer, ForeignKey("shares.id"))
+    share_id = Column(Integer, ForeignKey("shares.id"), index=True)
     share = relationship("Share", back_populates="files")
+
+    # NULL for files uploaded before the blob store existed; those own file_path outright.
+    # Blob-backed rows are located by digest through app.storage and leave file_path empty
+    blob_digest = Column(String(64), ForeignKey("blobs.digest"), nullable=True, index=True)
+    blob = relationship("Blob")
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
+    filename = Column(String)
+    size = Column(BigInteger, nullable=True)
+    # Finalize into this existing share instead of creating a new one
+    share_public_id = Column(String, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, index=True)
+
+    parts = relationship("UploadPart", back_populates="session", cascade="all, delete-orphan", passive_deletes=True, order_by="UploadPart.part_number")
+
+class UploadPart(Base):
+    __tablename__ = "upload_parts"
+
+    session_id = Column(String, ForeignKey("upload_sessions.id", ondelete="CASCADE"), primary_key=True)
+    part_number = Column(Integer, primary_key=True)
+    size = Column(BigInteger)
+
+    session = relationship("UploadSession", back_populates="parts")
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    # One row per periodic job registered in app/jobs.py
+    name = Column(String, primary_key=True)
+    run_at = Column(DateTime, nullable=False)
+    # Lease of the worker running the job, renewed while it runs; another worker may
+    # take the job over once it lapses
+    running_until = Column(DateTime, nullable=True)
+    locked_by = Column(String, nullable=True)
+    # Consecutive failures; drives the retry backoff
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(String, nullable=True)
+    last_started_at = Column(DateTime, nullable=True)
+    last_finished_at = Column(DateTime, nullable=True)
+    last_duration_ms = Column(Integer, nullable=True)
+
+class RateLimitBucket(Base):
+    __tablename__ = "rate_limits"
+
+    # Shared state of app/ratelimit.py with RATE_LIMIT_BACKEND=postgres; "<budget>:<client ip>"
+    key = Column(String, primary_key=True)
+    # When the bucket is full again (epoch seconds); rows in the past can be deleted
+    full_at = Column(Float, nullable=False)
@@ -0,0 +1,124 @@
+import asyncio
+from typing import Callable, Dict, List, Optional
+
+import asyncpg
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.db import engine
+
+# NOTIFY payloads must stay under 8000 bytes; items are batched up to this size
+_MAX_PAYLOAD = 7000
+_LISTEN_PING_SECONDS = 30
+_LISTEN_RETRY_SECONDS = 5
+
+
+class _Subscription:
+    def __init__(self, handler: Callable[[List[str]], None], on_connect, on_disconnect):
+        self.handler = handler
+        self.on_connect = on_connect
+        self.on_disconnect = on_disconnect
+
+
+_subscriptions: Dict[str, _Subscription] = {}
+
+
+def subscribe(
+    channel: str,
+    handler: Callable[[List[str]], None],
+    on_connect: Optional[Callable[[], None]] = None,
+    on_disconnect: Optional[Callable[[], None]] = None,
+):
+    """Call ``handler`` with the items of every message published on ``channel``,
+    by any worker including this one. ``on_connect`` runs once LISTEN is in
+    place (messages sent before it are lost), ``on_disconnect`` when it drops."""
+    _subscriptions[channel] = _Subscription(handler, on_connect, on_disconnect)
+
+
+def _payloads(items: List[str]) -> List[str]:
+    payloads, current, size = [], [], 0
+    for item in items:
+        if current and size + len(item) > _MAX_PAYLOAD:
+            payloads.append(",".join(current))
+            current, size = [], 0
+        current.append(item)
+        size += len(item) + 1
+    if current:
+        payloads.append(",".join(current))
+    return payloads
+
+
+async def publish(db: AsyncSession, channel: str, *items: str):
+    """Send ``items`` on ``channel`` to every worker once ``db`` commits.
+
+    Call before the commit. NOTIFY is transactional, so nothing is sent if
+    the transaction rolls back. This worker's handler also runs straight from
+    the after_commit hook below, without waiting for the round trip.
+    """
+    await db.run_sync(publish_sync, channel, *items)
+
+
+def publish_sync(session: Session, channel: str, *items: str):
+    """publish() for synchronous code on an AsyncSession's underlying Session,
+    such as Session event hooks."""
+    items = [item for item in items if item]
+    for payload in _payloads(items):
+        session.execute(select(func.pg_notify(channel, payload)))
+    session.info.setdefault("notifications", []).append((channel, items))
+
+
+@event.listens_for(Session, "after_commit")
+def _deliver_committed(session: Session):
+    for channel, items in session.info.pop("notifications", []):
+        subscription = _subscriptions.get(channel)
+        if subscription is not None and items:
+            subscription.handler(items)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session: Session):
+    session.info.pop("notifications", None)
+
+
+def _on_notification(connection, pid, channel, payload):
+    subscription = _subscriptions.get(channel)
+    if subscription is not None:
+        subscription.handler(payload.split(","))
+
+
+def _run_hooks(hook_name: str):
+    for subscription in _subscriptions.values():
+        hook = getattr(subscription, hook_name)
+        if hook is not None:
+            hook()
+
+
+async def listen_for_notifications():
+    """Deliver messages from other workers to subscribers; runs for the app's lifetime."""
+    dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(dsn)
+            lost = asyncio.Event()
+            connection.add_termination_listener(lambda c: lost.set())
+            for channel in _subscriptions:
+                await connection.add_listener(channel, _on_notification)
+            _run_hooks("on_connect")
+            while not lost.is_set():
+                try:
+                    await asyncio.wait_for(lost.wait(), _LISTEN_PING_SECONDS)
+                except asyncio.TimeoutError:
+                    # A half-open TCP connection would otherwise go unnoticed
+                    await asyncio.wait_for(connection.execute("SELECT 1"), _LISTEN_PING_SECONDS)
+            print("Notification listener lost its connection; reconnecting")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error in notification listener: {e}")
+        finally:
+            if connection is not None and not connection.is_closed():
+                connection.terminate()
+            _run_hooks("on_disconnect")
+        await asyncio.sleep(_LISTEN_RETRY_SECONDS)
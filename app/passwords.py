@@ -0,0 +1,26 @@
+"""bcrypt work, run inside the password pool's worker processes.
+
+Kept free of app imports so spawned workers start quickly.
+"""
+import time
+
+_pwd_context = None
+
+
+def _context():
+    # Built on first use, i.e. only in the pool workers; the app process never loads passlib
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
+
+
+def hash_password(password: str):
+    started = time.perf_counter()
+    return _context().hash(password), time.perf_counter() - started
+
+
+def check_password(plain_password: str, hashed_password: str):
+    started = time.perf_counter()
+    return _context().verify(plain_password, hashed_password), time.perf_counter() - started
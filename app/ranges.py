@@ -0,0 +1,253 @@
+import os
+import secrets
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from mimetypes import guess_type
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from app.metrics import Transfer
+
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", 256 * 1024))
+
+# More ranges than this in one request is treated as abuse and answered with the full body
+MAX_RANGES = 64
+
+# (start, end) with end exclusive
+ByteRange = Tuple[int, int]
+RangeReader = Callable[[int, int], AsyncIterator[bytes]]
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def _is_number(value: str) -> bool:
+    # Empty (an open end) or ASCII digits; str.isdigit() also accepts "²", which int() rejects
+    return value == "" or (value.isascii() and value.isdecimal())
+
+
+def parse_range_header(value: str, size: int) -> Optional[List[ByteRange]]:
+    """Parse a ``Range`` header (RFC 9110 section 14.2) against a body of ``size`` bytes.
+
+    Returns None when the header should be ignored (wrong unit, bad syntax,
+    too many ranges), otherwise the satisfiable ranges sorted and coalesced.
+    Raises RangeNotSatisfiable if no requested range overlaps the body.
+    """
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    parts = [p.strip() for p in spec.split(",") if p.strip()]
+    if not parts or len(parts) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for part in parts:
+        first, dash, last = part.partition("-")
+        first, last = first.strip(), last.strip()
+        if not dash or not _is_number(first) or not _is_number(last):
+            return None
+        if first == "":
+            # Suffix range: the final N bytes
+            if last == "":
+                return None
+            length = int(last)
+            if length == 0:
+                continue
+            ranges.append((max(size - length, 0), size))
+        else:
+            start = int(first)
+            end = int(last) + 1 if last else size
+            if last and end <= start:
+                return None
+            if start >= size:
+                continue
+            ranges.append((start, min(end, size)))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _etag_list(value: str) -> List[str]:
+    return [tag.strip() for tag in value.split(",") if tag.strip()]
+
+
+def _weak_match(a: str, b: str) -> bool:
+    return a.removeprefix("W/") == b.removeprefix("W/")
+
+
+def content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def local_file_reader(path: str, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> RangeReader:
+    async def read_range(start: int, end: int) -> AsyncIterator[bytes]:
+        f = await anyio.open_file(path, "rb")
+        try:
+            await f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = await f.read(min(chunk_size, remaining))
+                if not chunk:
+                    raise RuntimeError(f"File at path {path} is shorter than expected.")
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            with anyio.CancelScope(shield=True):
+                await f.aclose()
+    return read_range
+
+
+class RangedFileResponse(Response):
+    """File download with validators, conditional requests and byte ranges.
+
+    Handles ``If-None-Match`` / ``If-Modified-Since`` (304), ``Range`` with
+    single (206) and multiple (206 multipart/byteranges) ranges, ``If-Range``
+    and unsatisfiable ranges (416). The body is pulled from ``read_range`` so
+    the response does not care where the bytes live.
+    """
+
+    def __init__(
+        self,
+        read_range: RangeReader,
+        size: int,
+        etag: str,
+        filename: Optional[str] = None,
+        last_modified: Optional[datetime] = None,
+        media_type: Optional[str] = None,
+        headers: Optional[dict] = None,
+    ):
+        self.read_range = read_range
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0) if last_modified else None
+        self.status_code = 200
+        self.media_type = media_type or guess_type(filename or "")[0] or "application/octet-stream"
+        self.background = None
+        self.init_headers(headers)
+        self.headers["accept-ranges"] = "bytes"
+        self.headers["etag"] = etag
+        if self.last_modified:
+            self.headers["last-modified"] = format_datetime(self.last_modified, usegmt=True)
+        if filename is not None:
+            self.headers["content-disposition"] = content_disposition(filename)
+
+    def _not_modified(self, request_headers: Headers) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            return any(tag == "*" or _weak_match(tag, self.etag) for tag in _etag_list(if_none_match))
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since and self.last_modified:
+            try:
+                return self.last_modified <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _range_allowed(self, request_headers: Headers) -> bool:
+        if_range = request_headers.get("if-range")
+        if if_range is None:
+            return True
+        if_range = if_range.strip()
+        # If-Range needs a strong comparison; a weak or stale validator means "send everything"
+        if if_range.startswith('"') or if_range.startswith("W/"):
+            return if_range == self.etag and not if_range.startswith("W/")
+        return self.headers.get("last-modified") == if_range
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        request_headers = Headers(scope=scope)
+        head_only = scope["method"].upper() == "HEAD"
+
+        if self._not_modified(request_headers):
+            headers = [(k, v) for k, v in self.raw_headers if k not in (b"content-length", b"content-type", b"content-disposition")]
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        ranges = None
+        range_header = request_headers.get("range")
+        if range_header is not None and self._range_allowed(request_headers):
+            try:
+                ranges = parse_range_header(range_header, self.size)
+            except RangeNotSatisfiable:
+                response = Response(status_code=416, headers={
+                    "content-range": f"bytes */{self.size}",
+                    "accept-ranges": "bytes",
+                    "etag": self.etag,
+                })
+                await response(scope, receive, send)
+                return
+
+        if not ranges:
+            self.headers["content-length"] = str(self.size)
+            await self._send(scope, receive, send, 200, [(0, self.size)], None, head_only)
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            self.headers["content-length"] = str(end - start)
+            self.headers["content-range"] = f"bytes {start}-{end - 1}/{self.size}"
+            await self._send(scope, receive, send, 206, ranges, None, head_only)
+        else:
+            boundary = secrets.token_hex(13)
+            part_headers = [self._part_header(boundary, start, end) for start, end in ranges]
+            trailer = f"--{boundary}--\r\n".encode("latin-1")
+            length = sum(len(h) + (end - start) + 2 for h, (start, end) in zip(part_headers, ranges)) + len(trailer)
+            self.headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+            self.headers["content-length"] = str(length)
+            await self._send(scope, receive, send, 206, ranges, (part_headers, trailer), head_only)
+
+    def _part_header(self, boundary: str, start: int, end: int) -> bytes:
+        return (
+            f"--{boundary}\r\n"
+            f"Content-Type: {self.media_type}\r\n"
+            f"Content-Range: bytes {start}-{end - 1}/{self.size}\r\n"
+            "\r\n"
+        ).encode("latin-1")
+
+    async def _send(self, scope, receive, send, status, ranges, multipart, head_only):
+        await send({"type": "http.response.start", "status": status, "headers": self.raw_headers})
+        if head_only:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def stream_body():
+            for index, (start, end) in enumerate(ranges):
+                if multipart:
+                    await send({"type": "http.response.body", "body": multipart[0][index], "more_body": True})
+                async for chunk in self.read_range(start, end):
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                    transfer.add(len(chunk))
+                if multipart:
+                    await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+            await send({"type": "http.response.body", "body": multipart[1] if multipart else b"", "more_body": False})
+
+        # Stop reading the file as soon as the client goes away
+        with Transfer("download") as transfer:
+            async with anyio.create_task_group() as task_group:
+                async def stream_and_finish():
+                    await stream_body()
+                    task_group.cancel_scope.cancel()
+
+                task_group.start_soon(stream_and_finish)
+                while True:
+                    message = await receive()
+                    if message["type"] == "http.disconnect":
+                        task_group.cancel_scope.cancel()
+                        break
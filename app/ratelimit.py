@@ -0,0 +1,155 @@
+"""Per-client-IP rate limits for the public endpoints.
+
+Each budget is a token bucket holding up to ``burst`` requests and refilled at
+``per_minute``. It is stored as the single time at which the bucket will be
+full again (GCRA), so a check is one comparison. The memory backend keeps
+buckets per worker process: with N workers a client gets up to N times the
+budget. RATE_LIMIT_BACKEND=postgres shares the buckets between all workers
+and hosts, at the cost of a query per limited request.
+"""
+import ipaddress
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from fastapi import HTTPException, Request, status
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.db import AsyncSessionLocal, engine
+from app.jobs import register_job
+from app.logging_utils import get_real_ip
+from app.metrics import RATE_LIMIT_ERRORS, RATE_LIMITED
+from app.models import RateLimitBucket
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# "memory" (per worker process) or "postgres" (shared by the whole deployment)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+# Client IPs tracked per budget by the memory backend; the least recently seen are forgotten
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))
+# How often full buckets are deleted from the rate_limits table (postgres backend)
+RATE_LIMIT_GC_SECONDS = float(os.getenv("RATE_LIMIT_GC_SECONDS", 600))
+
+RATE_LIMIT_GC_JOB = "rate_limit_gc"
+
+
+class MemoryBuckets:
+    """Bounded LRU of client key -> time its bucket is full again (monotonic)."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._full_at: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, interval: float, window: float) -> float:
+        """Take a token; returns 0, or the seconds until one is available (nothing taken)."""
+        now = time.monotonic()
+        with self._lock:
+            full_at = max(self._full_at.get(key, now), now) + interval
+            if full_at - now > window:
+                return full_at - now - window
+            self._full_at[key] = full_at
+            self._full_at.move_to_end(key)
+            while len(self._full_at) > self.maxsize:
+                self._full_at.popitem(last=False)
+        return 0.0
+
+
+_memory_buckets = MemoryBuckets(RATE_LIMIT_MAX_KEYS)
+
+
+async def _take_shared(key: str, interval: float, window: float) -> float:
+    now = func.extract("epoch", func.now())
+    full_at = func.greatest(RateLimitBucket.full_at, now) + interval
+    async with engine.begin() as connection:
+        # One round trip: the row is only written (and returned) if a token was available
+        taken = await connection.execute(
+            insert(RateLimitBucket)
+            .values(key=key, full_at=now + interval)
+            .on_conflict_do_update(
+                index_elements=[RateLimitBucket.key],
+                set_={"full_at": full_at},
+                where=full_at - now <= window,
+            )
+            .returning(RateLimitBucket.key)
+        )
+        if taken.first() is not None:
+            return 0.0
+        wait = await connection.scalar(select(full_at - now - window).where(RateLimitBucket.key == key))
+    return max(float(wait or 0), 0.0)
+
+
+def client_key(ip: str) -> str:
+    """Bucket key of a client address: IPv6 clients usually hold a whole /64, so they share one."""
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return ip
+    if address.version == 6 and address.ipv4_mapped is None:
+        return str(ipaddress.ip_network(f"{address}/64", strict=False))
+    return ip
+
+
+class RateLimit:
+    """FastAPI dependency that allows each client IP ``per_minute`` requests on
+    average, and ``burst`` in a row; beyond that it answers 429 with Retry-After.
+    ``per_minute`` 0 disables the budget."""
+
+    def __init__(self, name: str, per_minute: float, burst: int):
+        self.name = name
+        self.per_minute = per_minute
+        self.burst = max(burst, 1)
+
+    async def __call__(self, request: Request):
+        if not RATE_LIMIT_ENABLED or self.per_minute <= 0:
+            return
+        interval = 60 / self.per_minute
+        window = self.burst * interval
+        key = f"{self.name}:{client_key(get_real_ip(request))}"
+        if RATE_LIMIT_BACKEND == "postgres":
+            try:
+                wait = await _take_shared(key, interval, window)
+            except Exception as e:
+                # Rather serve than fail every public request while the database is unreachable
+                RATE_LIMIT_ERRORS.inc()
+                print(f"Error checking rate limit {self.name}: {e}")
+                return
+        else:
+            wait = _memory_buckets.take(key, interval, window)
+        if wait > 0:
+            RATE_LIMITED.labels(self.name).inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, please retry later",
+                headers={"Retry-After": str(max(math.ceil(wait), 1))},
+            )
+
+
+def _budget(name: str, per_minute: float, burst: int) -> RateLimit:
+    prefix = f"RATE_LIMIT_{name.upper()}"
+    return RateLimit(
+        name,
+        float(os.getenv(f"{prefix}_PER_MINUTE", per_minute)),
+        int(os.getenv(f"{prefix}_BURST", burst)),
+    )
+
+
+# Password attempts (each one a bcrypt verify) on /public/share/{id}/unlock
+limit_unlocks = _budget("unlock", 10, 5)
+# Share pages and file listings; also what a scanner guessing public ids hits
+limit_share_views = _budget("view", 120, 60)
+# File and archive downloads; range requests of download managers each count
+limit_downloads = _budget("download", 600, 200)
+
+
+async def purge_full_buckets(now: datetime):
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(RateLimitBucket).where(RateLimitBucket.full_at < func.extract("epoch", func.now())))
+        await db.commit()
+
+
+if RATE_LIMIT_BACKEND == "postgres":
+    register_job(RATE_LIMIT_GC_JOB, purge_full_buckets, every=RATE_LIMIT_GC_SECONDS)
@@ -0,0 +1,208 @@
+"""Routing of read-only endpoints to the read replica (DATABASE_READ_URL).
+
+Read sessions go to the replica unless it is down or lagging more than
+REPLICA_MAX_LAG_SECONDS, or the data being read was written in the last
+READ_YOUR_WRITES_SECONDS: by the signed-in user (any commit of a session that
+get_current_user saw) or to the public share (notify_share_changed). Recent
+writes are shared between workers over LISTEN/NOTIFY, since the next request
+may land on another worker.
+
+Without DATABASE_READ_URL every read session is a primary session.
+"""
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from fastapi import Depends
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.auth import get_current_user
+from app.db import AsyncSessionLocal, ReadSessionLocal, engine, get_db, read_engine
+from app.metrics import DB_READ_ROUTES, DB_REPLICA_LAG_SECONDS, DB_REPLICA_USABLE
+from app.models import User
+from app.notify import publish_sync, subscribe
+
+# After a write, reads of the same user's (or share's) data go to the primary this long; keep above the max lag
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", 10))
+# Replication lag beyond which reads fall back to the primary
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", 2))
+# How often each worker checks the replica's health and lag
+REPLICA_CHECK_SECONDS = float(os.getenv("REPLICA_CHECK_SECONDS", 2))
+
+RECENT_WRITES_CHANNEL = "recent_writes"
+
+
+class RecentWrites:
+    """Keys ("u:<user id>", "s:<public id>") written in the last ``window`` seconds."""
+
+    def __init__(self, window: float):
+        self.window = window
+        self._until: Dict[str, float] = {}
+        self._all_until = 0.0
+        self._lock = threading.Lock()
+
+    def mark(self, *keys: str):
+        now = time.monotonic()
+        with self._lock:
+            # Expired keys are dropped here, so the dict only holds the last window's writes
+            self._until = {k: t for k, t in self._until.items() if t > now}
+            for key in keys:
+                self._until[key] = now + self.window
+
+    def mark_all(self):
+        """Treat everything as recently written, e.g. after missing notifications."""
+        with self._lock:
+            self._all_until = time.monotonic() + self.window
+
+    def contains(self, key: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            return self._all_until > now or self._until.get(key, 0.0) > now
+
+
+recent_writes = RecentWrites(READ_YOUR_WRITES_SECONDS)
+
+
+class ReplicaStatus:
+    def __init__(self):
+        # Unusable until the first check succeeds
+        self.usable = False
+        self.lag: Optional[float] = None
+
+    def update(self, lag: Optional[float]):
+        self.lag = lag
+        self.usable = lag is not None and lag <= REPLICA_MAX_LAG_SECONDS
+        DB_REPLICA_USABLE.set(1 if self.usable else 0)
+        if lag is not None:
+            DB_REPLICA_LAG_SECONDS.set(lag)
+
+
+replica_status = ReplicaStatus()
+
+
+def _parse_lsn(lsn: str) -> int:
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+async def check_replica() -> float:
+    """Seconds the replica is behind the primary (0 when caught up, or when
+    DATABASE_READ_URL is just another URL of the primary)."""
+    async with read_engine.connect() as connection:
+        row = (await connection.execute(select(
+            func.pg_is_in_recovery(),
+            func.pg_last_wal_replay_lsn(),
+            func.extract("epoch", func.now() - func.pg_last_xact_replay_timestamp()),
+        ))).one()
+    in_recovery, replay_lsn, replay_age = row
+    if not in_recovery:
+        return 0.0
+    async with engine.connect() as connection:
+        current_lsn = await connection.scalar(select(func.pg_current_wal_lsn()))
+    # Everything is replayed: an old replay timestamp only means the primary has been idle
+    if replay_lsn is not None and _parse_lsn(str(replay_lsn)) >= _parse_lsn(str(current_lsn)):
+        return 0.0
+    return float(replay_age) if replay_age is not None else float("inf")
+
+
+async def monitor_replica():
+    """Keep replica_status current; runs for the app's lifetime when a replica is configured."""
+    while True:
+        try:
+            replica_status.update(await check_replica())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if replica_status.usable:
+                print(f"Read replica unavailable, reading from the primary: {e}")
+            replica_status.update(None)
+        await asyncio.sleep(REPLICA_CHECK_SECONDS)
+
+
+async def _read_session(key: Optional[str], primary: Optional[AsyncSession] = None):
+    if read_engine is None:
+        target, reason = "primary", "no_replica"
+    elif key is not None and recent_writes.contains(key):
+        target, reason = "primary", "recent_write"
+    elif not replica_status.usable:
+        target, reason = "primary", "replica_unavailable"
+    else:
+        target, reason = "replica", "ok"
+    DB_READ_ROUTES.labels(target, reason).inc()
+
+    if target == "replica":
+        async with ReadSessionLocal() as session:
+            yield session
+    elif primary is not None:
+        yield primary
+    else:
+        async with AsyncSessionLocal() as session:
+            yield session
+
+
+# For code that only sometimes needs a read session: ``async with read_session() as db``
+read_session = asynccontextmanager(_read_session)
+
+
+async def get_read_db():
+    """Session for reads that may be slightly stale (the replica when healthy)."""
+    async for session in _read_session(None):
+        yield session
+
+
+async def get_share_read_db(public_id: str):
+    """Read session for the public pages of share ``public_id``."""
+    async for session in _read_session(f"s:{public_id}"):
+        yield session
+
+
+async def get_user_read_db(current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    """Read session for the signed-in user's own data; the primary right after they changed something."""
+    async for session in _read_session(f"u:{current_user.id}", db):
+        yield session
+
+
+# Sessions of signed-in users (auth.get_current_user sets info["user_id"]) announce their writes
+
+@event.listens_for(Session, "after_flush")
+def _note_flush(session: Session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _note_bulk_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(Session, "before_commit")
+def _publish_user_write(session: Session):
+    user_id = session.info.get("user_id")
+    if read_engine is None or user_id is None:
+        return
+    if session.info.get("wrote") or session.new or session.dirty or session.deleted:
+        publish_sync(session, RECENT_WRITES_CHANNEL, f"u:{user_id}")
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _forget_write(session: Session):
+    session.info.pop("wrote", None)
+
+
+def _on_recent_writes(keys):
+    recent_writes.mark(*keys)
+
+
+# Writes announced while nobody was listening are unknown, so trust nothing for a window
+subscribe(
+    RECENT_WRITES_CHANNEL,
+    _on_recent_writes,
+    on_connect=recent_writes.mark_all,
+    on_disconnect=recent_writes.mark_all,
+)
@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.notify import publish, subscribe
+
+# Lifetime of a download link, and so how long a revocation has to be remembered
+DOWNLOAD_TOKEN_MINUTES = int(os.getenv("DOWNLOAD_TOKEN_MINUTES", 60))
+
+REVOCATION_CHANNEL = "download_revocations"
+
+# Allowance for clock differences between the worker that signed a token and this one
+_CLOCK_SKEW_SECONDS = 5
+
+
+class RevocationSet:
+    """Shares and files deleted within the last DOWNLOAD_TOKEN_MINUTES.
+
+    Every worker learns about revocations over LISTEN/NOTIFY, so the set is
+    only complete for tokens issued while this worker was listening; older
+    tokens have to be checked against the database (see ``covers``).
+    """
+
+    def __init__(self, retention: float):
+        self.retention = retention
+        self.listening_since: Optional[float] = None
+        self._entries: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, items: List[str]):
+        now = time.monotonic()
+        with self._lock:
+            for item in items:
+                self._entries[item] = now
+                self._entries.move_to_end(item)
+            # Oldest first, so pruning stops at the first entry still needed
+            while self._entries:
+                item, revoked = next(iter(self._entries.items()))
+                if now - revoked < self.retention:
+                    break
+                del self._entries[item]
+
+    def covers(self, issued_at: float) -> bool:
+        """Whether every revocation since ``issued_at`` (epoch seconds) is known here."""
+        return self.listening_since is not None and issued_at >= self.listening_since + _CLOCK_SKEW_SECONDS
+
+    def is_revoked(self, public_id: str, file_id: int) -> bool:
+        with self._lock:
+            return f"s:{public_id}" in self._entries or f"f:{file_id}" in self._entries
+
+    def start_listening(self):
+        self.listening_since = time.time()
+
+    def stop_listening(self):
+        self.listening_since = None
+
+
+revocations = RevocationSet(DOWNLOAD_TOKEN_MINUTES * 60)
+
+
+async def revoke_downloads(db: AsyncSession, share_ids: List[str] = (), file_ids: List[int] = ()):
+    """Invalidate outstanding download links for the given shares (by public id)
+    and files, in every worker once ``db`` commits. Call before the commit."""
+    await publish(
+        db,
+        REVOCATION_CHANNEL,
+        *[f"s:{public_id}" for public_id in share_ids],
+        *[f"f:{file_id}" for file_id in file_ids],
+    )
+
+
+subscribe(
+    REVOCATION_CHANNEL,
+    revocations.add,
+    on_connect=revocations.start_listening,
+    on_disconnect=revocations.stop_listening,
+)
@@ -8,6 +8,7 @@ from opentelemetry import trace
 from app.db import get_db
 from app.models import User
 from app.schemas import UserResponse, Token, ChangePassword
+from app.user_cache import user_cache
 from app.auth import get_password_hash, verify_password, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, get_current_user
 
 router = APIRouter()
@@ -31,7 +32,7 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
             db_span.set_attribute("db.result.count", 1 if user else 0)
             db_span.set_attribute("db.user_found", user is not None)
         
-        if not user or not verify_password(form_data.password, user.hashed_password):
+        if not user or not await verify_password(form_data.password, user.hashed_password):
             span.set_attribute("auth.success", False)
             span.set_attribute("auth.error", "invalid_credentials")
             raise HTTPException(
@@ -45,7 +46,7 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
         
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         access_token = create_access_token(
-            data={"sub": user.username}, expires_delta=access_token_expires
+            data={"sub": user.username, "uid": user.id}, expires_delta=access_token_expires
         )
         return {
         "access_token": access_token, 
@@ -59,8 +60,9 @@ async def change_password(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    current_user.hashed_password = get_password_hash(data.new_password)
+    current_user.hashed_password = await get_password_hash(data.new_password)
     current_user.must_change_password = False
     db.add(current_user)
     await db.commit()
+    user_cache.invalidate(current_user.username)
     return {"message": "Password changed successfully"}
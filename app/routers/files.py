@@ -1,65 +1,88 @@
-import shutil
+import base64
 import os
-import uuid
-from typing import List
+from typing import List, Optional
 from datetime import datetime, timedelta
-from fastapi import APIRouter, Depends, UploadFile, File, Request, HTTPException
+from fastapi import APIRouter, Depends, Request, HTTPException, Query
+from opentelemetry import trace
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, func, tuple_
 from sqlalchemy.orm import selectinload
 
 from app.db import get_db
 from app.models import User, FileRecord, Share
-from app.schemas import ShareResponse, ShareUpdate, FileResponse, ShareListItem
+from app.schemas import (
+    ShareResponse, ShareUpdate, FileResponse, ShareListItem, ShareListPage,
+    BlobCheckRequest, BlobCheckResponse, BlobAttachRequest
+)
 from app.auth import get_current_user, get_password_hash
 from app.logging_utils import log_event
+from app.uploads import MULTIPART_FILES_OPENAPI, IngestResult, ingest_multipart
+from app.tasks import schedule_expiry
+from app.share_cache import notify_share_changed
+from app.replica import get_user_read_db
+from app.revocations import revoke_downloads
+from app.blobs import (
+    acquire_blobs, attach_blobs, delete_released, discard_ingest, owned_digests, release_files
+)
+from app.storage import DIGEST_RE
 
 router = APIRouter()
 
-FILES_DIR = "files"
+def record_upload_throughput(ingest: IngestResult):
+    span = trace.get_current_span()
+    span.set_attribute("upload.files", len(ingest.files))
+    span.set_attribute("upload.bytes", ingest.bytes_received)
+    span.set_attribute("upload.seconds", ingest.seconds)
+    span.set_attribute("upload.throughput_bps", ingest.throughput)
 
-@router.post("/upload", response_model=ShareResponse)
+@router.post("/upload", response_model=ShareResponse, openapi_extra=MULTIPART_FILES_OPENAPI)
 async def upload_files(
     request: Request,
-    files: List[UploadFile] = File(...), 
     current_user: User = Depends(get_current_user), 
     db: AsyncSession = Depends(get_db)
 ):
-    os.makedirs(FILES_DIR, exist_ok=True)
-    
-    # Create a new Share with default 30-minute expiration
-    new_share = Share(
-        owner_id=current_user.id,
-        expires_at=datetime.utcnow() + timedelta(minutes=30)
-    )
-    db.add(new_share)
-    await db.flush() # get ID
+    # Give the pooled connection back while the body streams in
+    await db.commit()
+    ingest = await ingest_multipart(request)
 
-    uploaded_files = []
+    try:
+        # Create a new Share with default 30-minute expiration
+        new_share = Share(
+            owner_id=current_user.id,
+            expires_at=datetime.utcnow() + timedelta(minutes=30)
+        )
+        db.add(new_share)
+        await db.flush() # get ID
+        # Announced like any share change, so its public page is read from the primary at first
+        await notify_share_changed(db, new_share.public_id)
 
-    for file in files:
-        unique_filename = f"{uuid.uuid4()}_{file.filename}"
-        file_path = os.path.join(FILES_DIR, unique_filename)
+        await acquire_blobs(db, ingest.files)
+        uploaded_files = []
+
+        for ingested in ingest.files:
+            db_file = FileRecord(
+                filename=ingested.filename,
+                blob_digest=ingested.digest,
+                share_id=new_share.id
+            )
+            db.add(db_file)
+            uploaded_files.append(db_file)
         
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        db_file = FileRecord(
-            filename=file.filename,
-            file_path=file_path,
-            share_id=new_share.id
-        )
-        db.add(db_file)
-        uploaded_files.append(db_file)
-    
-    await db.commit()
+        await db.commit()
+    except BaseException:
+        await discard_ingest(db, ingest.files)
+        raise
     await db.refresh(new_share)
     
+    record_upload_throughput(ingest)
     # Log the upload event
     log_event("upload", {
         "username": current_user.username,
         "share_id": new_share.public_id,
-        "files": [f.filename for f in uploaded_files]
+        "files": [f.filename for f in uploaded_files],
+        "bytes": ingest.bytes_received,
+        "seconds": round(ingest.seconds, 3),
+        "throughput_bps": int(ingest.throughput)
     }, request)
     
     base_url = os.getenv("BASE_URL", "http://localhost:3000")
@@ -95,29 +118,60 @@ async def update_share_settings(
         if share_settings.password == "":
              share.password_hash = None
         else:
-             share.password_hash = get_password_hash(share_settings.password)
+             share.password_hash = await get_password_hash(share_settings.password)
         
     if share_settings.expires_minutes is not None:
         if share_settings.expires_minutes > 1440:
              raise HTTPException(status_code=400, detail="Expiration time cannot exceed 1 day (1440 minutes)")
         share.expires_at = datetime.utcnow() + timedelta(minutes=share_settings.expires_minutes)
         
+    await notify_share_changed(db, share.public_id)
     await db.commit()
+    schedule_expiry(share.expires_at)
     
     return {"message": "Share settings updated"}
 
-@router.get("/shares", response_model=List[ShareListItem])
+def encode_share_cursor(share: Share) -> str:
+    raw = f"{share.created_at.isoformat()}|{share.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_share_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, share_id = raw.split("|")
+        return datetime.fromisoformat(created_at), int(share_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/shares", response_model=ShareListPage)
 async def get_user_shares(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
     current_user: User = Depends(get_current_user), 
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_user_read_db)
 ):
-    result = await db.execute(
+    # Keyset pagination, newest first; served by ix_shares_owner_created
+    query = (
         select(Share)
-        .options(selectinload(Share.files))
         .where(Share.owner_id == current_user.id)
-        .order_by(Share.created_at.desc())
+        .order_by(Share.created_at.desc(), Share.id.desc())
+        .limit(limit + 1)
     )
+    if cursor:
+        query = query.where(tuple_(Share.created_at, Share.id) < decode_share_cursor(cursor))
+    result = await db.execute(query)
     shares = result.scalars().all()
+    has_more = len(shares) > limit
+    shares = shares[:limit]
+
+    file_counts = {}
+    if shares:
+        result = await db.execute(
+            select(FileRecord.share_id, func.count(FileRecord.id))
+            .where(FileRecord.share_id.in_([s.id for s in shares]))
+            .group_by(FileRecord.share_id)
+        )
+        file_counts = dict(result.all())
     
     base_url = os.getenv("BASE_URL", "http://localhost:3000")
     if not base_url.endswith("/"):
@@ -128,20 +182,23 @@ async def get_user_shares(
         share_list.append(ShareListItem(
             public_id=share.public_id,
             share_link=f"{base_url}download/{share.public_id}",
-            file_count=len(share.files),
+            file_count=file_counts.get(share.id, 0),
             expires_at=share.expires_at,
             password_protected=bool(share.password_hash),
             created_at=share.created_at,
             is_shared=share.is_shared
         ))
     
-    return share_list
+    return ShareListPage(
+        items=share_list,
+        next_cursor=encode_share_cursor(shares[-1]) if has_more else None
+    )
 
 @router.get("/share/{public_id}", response_model=ShareResponse)
 async def get_share_details(
     public_id: str,
     current_user: User = Depends(get_current_user), 
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_user_read_db)
 ):
     result = await db.execute(
         select(Share)
@@ -183,25 +240,23 @@ async def delete_share(
     if not share:
         raise HTTPException(status_code=404, detail="Share not found")
     
-    # Delete files from filesystem
-    for file_record in share.files:
-        try:
-            if os.path.exists(file_record.file_path):
-                os.remove(file_record.file_path)
-        except Exception as e:
-            print(f"Error deleting file {file_record.file_path}: {e}")
-    
     # Delete share and associated files (cascade will handle files in DB)
+    file_records = list(share.files)
     await db.delete(share)
+    await db.flush()
+    # Blobs whose last reference was in this share are unlinked once the delete is committed
+    released = await release_files(db, file_records)
+    await notify_share_changed(db, share.public_id)
+    await revoke_downloads(db, share_ids=[share.public_id])
     await db.commit()
+    await delete_released(released)
     
     return {"message": "Share deleted successfully"}
 
-@router.post("/share/{public_id}/files", response_model=ShareResponse)
+@router.post("/share/{public_id}/files", response_model=ShareResponse, openapi_extra=MULTIPART_FILES_OPENAPI)
 async def add_files_to_share(
     public_id: str,
     request: Request,
-    files: List[UploadFile] = File(...),
     current_user: User = Depends(get_current_user), 
     db: AsyncSession = Depends(get_db)
 ):
@@ -215,32 +270,38 @@ async def add_files_to_share(
     if not share:
         raise HTTPException(status_code=404, detail="Share not found")
     
-    os.makedirs(FILES_DIR, exist_ok=True)
-    
+    # Give the pooled connection back while the body streams in
+    await db.commit()
+    ingest = await ingest_multipart(request)
+
     uploaded_files = []
-    for file in files:
-        unique_filename = f"{uuid.uuid4()}_{file.filename}"
-        file_path = os.path.join(FILES_DIR, unique_filename)
+    try:
+        await acquire_blobs(db, ingest.files)
+        for ingested in ingest.files:
+            db_file = FileRecord(
+                filename=ingested.filename,
+                blob_digest=ingested.digest,
+                share_id=share.id
+            )
+            db.add(db_file)
+            uploaded_files.append(db_file)
         
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        db_file = FileRecord(
-            filename=file.filename,
-            file_path=file_path,
-            share_id=share.id
-        )
-        db.add(db_file)
-        uploaded_files.append(db_file)
-    
-    await db.commit()
+        await notify_share_changed(db, share.public_id)
+        await db.commit()
+    except BaseException:
+        await discard_ingest(db, ingest.files)
+        raise
     await db.refresh(share)
     
+    record_upload_throughput(ingest)
     # Log the file addition event
     log_event("add_files", {
         "username": current_user.username,
         "share_id": share.public_id,
-        "files": [f.filename for f in uploaded_files]
+        "files": [f.filename for f in uploaded_files],
+        "bytes": ingest.bytes_received,
+        "seconds": round(ingest.seconds, 3),
+        "throughput_bps": int(ingest.throughput)
     }, request)
     
     base_url = os.getenv("BASE_URL", "http://localhost:3000")
@@ -280,15 +341,144 @@ async def delete_file_from_share(
     if not file_record:
         raise HTTPException(status_code=404, detail="File not found")
     
-    # Delete file from filesystem
-    try:
-        if os.path.exists(file_record.file_path):
-            os.remove(file_record.file_path)
-    except Exception as e:
-        print(f"Error deleting file {file_record.file_path}: {e}")
-    
-    # Delete file from database
+    # Delete file from database, then the blob if nothing else references it
     await db.delete(file_record)
+    await db.flush()
+    released = await release_files(db, [file_record])
+    await notify_share_changed(db, share.public_id)
+    await revoke_downloads(db, file_ids=[file_record.id])
     await db.commit()
+    await delete_released(released)
     
     return {"message": "File deleted successfully"}
+
+def validate_digests(digests: List[str]) -> List[str]:
+    digests = [d.lower() for d in digests]
+    for digest in digests:
+        if not DIGEST_RE.match(digest):
+            raise HTTPException(status_code=400, detail=f"Invalid SHA-256 digest: {digest}")
+    return digests
+
+@router.post("/blobs/check", response_model=BlobCheckResponse)
+async def check_blobs(
+    data: BlobCheckRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Upload preflight: tells the client which contents it can attach by hash
+    via /upload/by-hash or /share/{public_id}/files/by-hash instead of sending them.
+    Only the caller's own files count; anything else has to be uploaded."""
+    digests = validate_digests(data.digests)
+    if len(digests) > 1000:
+        raise HTTPException(status_code=400, detail="At most 1000 digests per request")
+    present = set(await owned_digests(db, digests, current_user.id)) if digests else set()
+    return BlobCheckResponse(
+        present=[d for d in digests if d in present],
+        missing=[d for d in digests if d not in present]
+    )
+
+async def attach_files_by_hash(db: AsyncSession, share: Share, data: BlobAttachRequest) -> List[FileRecord]:
+    digests = validate_digests([f.digest for f in data.files])
+    if not digests:
+        raise HTTPException(status_code=400, detail="No files given")
+    try:
+        await attach_blobs(db, digests, share.owner_id)
+    except KeyError as e:
+        await db.rollback()
+        raise HTTPException(status_code=404, detail=f"Unknown blob: {e.args[0]}")
+
+    attached = []
+    for ref, digest in zip(data.files, digests):
+        db_file = FileRecord(
+            filename=ref.filename,
+            blob_digest=digest,
+            share_id=share.id
+        )
+        db.add(db_file)
+        attached.append(db_file)
+    return attached
+
+@router.post("/upload/by-hash", response_model=ShareResponse)
+async def upload_files_by_hash(
+    request: Request,
+    data: BlobAttachRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Create a new Share with default 30-minute expiration
+    new_share = Share(
+        owner_id=current_user.id,
+        expires_at=datetime.utcnow() + timedelta(minutes=30)
+    )
+    db.add(new_share)
+    await db.flush() # get ID
+    await notify_share_changed(db, new_share.public_id)
+
+    uploaded_files = await attach_files_by_hash(db, new_share, data)
+    await db.commit()
+    await db.refresh(new_share)
+
+    log_event("upload", {
+        "username": current_user.username,
+        "share_id": new_share.public_id,
+        "files": [f.filename for f in uploaded_files],
+        "deduplicated": True
+    }, request)
+
+    base_url = os.getenv("BASE_URL", "http://localhost:3000")
+    if not base_url.endswith("/"):
+        base_url += "/"
+
+    return ShareResponse(
+        public_id=new_share.public_id,
+        share_link=f"{base_url}download/{new_share.public_id}",
+        files=[FileResponse(id=f.id, filename=f.filename) for f in uploaded_files],
+        expires_at=new_share.expires_at,
+        password_protected=bool(new_share.password_hash)
+    )
+
+@router.post("/share/{public_id}/files/by-hash", response_model=ShareResponse)
+async def add_files_to_share_by_hash(
+    public_id: str,
+    request: Request,
+    data: BlobAttachRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    result = await db.execute(
+        select(Share).where(Share.public_id == public_id, Share.owner_id == current_user.id)
+    )
+    share = result.scalars().first()
+
+    if not share:
+        raise HTTPException(status_code=404, detail="Share not found")
+
+    uploaded_files = await attach_files_by_hash(db, share, data)
+    await notify_share_changed(db, share.public_id)
+    await db.commit()
+
+    log_event("add_files", {
+        "username": current_user.username,
+        "share_id": share.public_id,
+        "files": [f.filename for f in uploaded_files],
+        "deduplicated": True
+    }, request)
+
+    result = await db.execute(
+        select(FileRecord).where(FileRecord.share_id == share.id).order_by(FileRecord.id)
+    )
+    files = result.scalars().all()
+
+    base_url = os.getenv("BASE_URL", "http://localhost:3000")
+    if not base_url.endswith("/"):
+        base_url += "/"
+
+    return ShareResponse(
+        public_id=share.public_id,
+        share_link=f"{base_url}download/{share.public_id}",
+        files=[FileResponse(id=f.id, filename=f.filename) for f in files],
+        expires_at=share.expires_at,
+        password_protected=bool(share.password_hash),
+        created_at=share.created_at,
+        is_shared=share.is_shared
+    )
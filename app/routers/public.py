@@ -1,20 +1,47 @@
+import hashlib
+import hmac
+import os
+from functools import partial
 from datetime import datetime, timedelta
+from mimetypes import guess_type
+from urllib.parse import quote
 from typing import List, Optional
-from fastapi import APIRouter, Depends, Request, Body, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import APIRouter, Depends, Request, Body, HTTPException, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, func
 from sqlalchemy.orm import selectinload
 from pydantic import BaseModel
 from jose import jwt, JWTError
 
 from app.db import get_db
+from app.replica import get_share_read_db, read_session
+from app.ratelimit import limit_downloads, limit_share_views, limit_unlocks
 from app.models import Share, FileRecord
-from app.auth import verify_password
+from app.auth import ALGORITHM, SECRET_KEY, verify_password
 from app.logging_utils import log_event
-# Reuse config from main/auth (should be in config file)
-SECRET_KEY = "supersecretkeychangedthisinproduction" 
-ALGORITHM = "HS256"
+from app.ranges import DOWNLOAD_CHUNK_SIZE, RangedFileResponse, content_disposition
+from app.share_cache import MISSING, CachedShare, share_cache
+from app.revocations import DOWNLOAD_TOKEN_MINUTES, revocations
+from app.metrics import DOWNLOAD_TOKEN_LOOKUPS, count_download
+from app.storage import DIGEST_RE, StoredObject, record_key, storage
+from app.zipstream import ZipEntry, iter_zip, unique_arcnames
+# Signs download, archive and share-access tokens. Kept apart from the login key so that neither
+# kind of token passes for the other; derived from SECRET_KEY unless set
+PUBLIC_TOKEN_SECRET_KEY = os.getenv("PUBLIC_TOKEN_SECRET_KEY") or hmac.new(
+    SECRET_KEY.encode(), b"public-tokens", hashlib.sha256
+).hexdigest()
+
+# When set (e.g. "/_protected_files/"), downloads are handed to nginx via X-Accel-Redirect
+# instead of streaming through Python; see the matching location in frontend/nginx.conf
+DOWNLOAD_ACCEL_REDIRECT_PREFIX = os.getenv("DOWNLOAD_ACCEL_REDIRECT_PREFIX", "")
+
+# Files (and so download tokens signed) per page of a public share listing
+PUBLIC_FILES_PAGE_SIZE = int(os.getenv("PUBLIC_FILES_PAGE_SIZE", 100))
+
+# How long a successful unlock is remembered for a visitor
+SHARE_ACCESS_GRANT_MINUTES = int(os.getenv("SHARE_ACCESS_GRANT_MINUTES", 60))
 
 router = APIRouter(prefix="/public")
 
@@ -27,23 +54,136 @@ class PublicFile(BaseModel):
 
 class PublicShareResponse(BaseModel):
     locked: bool
-    files: List[PublicFile] = []
+    files: List[PublicFile] = [] # First page only; fetch the rest from /public/share/{id}/files
+    file_count: int = 0
+    next_cursor: Optional[str] = None
+    archive_token: Optional[str] = None # Signed token for /public/zip/{token}
+
+class PublicFilePage(BaseModel):
+    files: List[PublicFile]
+    next_cursor: Optional[str] = None
+
+def create_download_token(file_id: int, filename: str, key: str, share: CachedShare):
+    now = datetime.utcnow()
+    expire = now + timedelta(minutes=DOWNLOAD_TOKEN_MINUTES)
+    if share.expires_at and share.expires_at < expire:
+        expire = share.expires_at
+    # Carries everything download_file needs, so it can serve without a query
+    to_encode = {
+        "sub": str(file_id), "exp": expire, "iat": now, "type": "download",
+        "key": key, "name": filename, "shr": share.public_id
+    }
+    return jwt.encode(to_encode, PUBLIC_TOKEN_SECRET_KEY, algorithm=ALGORITHM)
 
-def create_download_token(file_id: int):
+def create_archive_token(share: CachedShare):
     expire = datetime.utcnow() + timedelta(minutes=60) # Link valid for 1 hour
-    to_encode = {"sub": str(file_id), "exp": expire, "type": "download"}
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    if share.expires_at and share.expires_at < expire:
+        expire = share.expires_at
+    to_encode = {"sub": str(share.id), "exp": expire, "type": "archive"}
+    return jwt.encode(to_encode, PUBLIC_TOKEN_SECRET_KEY, algorithm=ALGORITHM)
 
-@router.get("/share/{public_id}", response_model=PublicShareResponse)
-async def get_share_status(request: Request, public_id: str, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Share).where(Share.public_id == public_id).options(selectinload(Share.files)))
-    share = result.scalars().first()
+def share_access_cookie_name(public_id: str) -> str:
+    return f"share_access_{public_id}"
+
+def password_fingerprint(password_hash: str) -> str:
+    # Changes whenever the password does (new bcrypt salt), which revokes outstanding grants
+    return hashlib.sha256(password_hash.encode()).hexdigest()[:16]
+
+def create_share_access_grant(share: CachedShare):
+    expire = datetime.utcnow() + timedelta(minutes=SHARE_ACCESS_GRANT_MINUTES)
+    to_encode = {"sub": str(share.id), "exp": expire, "type": "share_access", "pwd": password_fingerprint(share.password_hash)}
+    return jwt.encode(to_encode, PUBLIC_TOKEN_SECRET_KEY, algorithm=ALGORITHM)
+
+def has_share_access_grant(request: Request, share: CachedShare) -> bool:
+    grant = request.cookies.get(share_access_cookie_name(share.public_id))
+    if not grant:
+        return False
+    try:
+        payload = jwt.decode(grant, PUBLIC_TOKEN_SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return False
+    return (
+        payload.get("type") == "share_access"
+        and payload.get("sub") == str(share.id)
+        and payload.get("pwd") == password_fingerprint(share.password_hash)
+    )
+
+async def fetch_file_rows(db: AsyncSession, share_id: int, after_id: int, limit: int):
+    result = await db.execute(
+        select(FileRecord.id, FileRecord.filename, FileRecord.blob_digest, FileRecord.file_path)
+        .where(FileRecord.share_id == share_id, FileRecord.id > after_id)
+        .order_by(FileRecord.id)
+        .limit(limit + 1)
+    )
+    rows = [(row.id, row.filename, record_key(row)) for row in result.all()]
+    next_cursor = str(rows[limit - 1][0]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def public_file_page(share: CachedShare, rows, next_cursor: Optional[str]) -> PublicFilePage:
+    # Download tokens are minted for this page only, so cost does not grow with the share
+    files = [
+        PublicFile(filename=filename, token=create_download_token(file_id, filename, key, share))
+        for file_id, filename, key in rows
+    ]
+    return PublicFilePage(files=files, next_cursor=next_cursor)
+
+def unlocked_share_response(share: CachedShare) -> PublicShareResponse:
+    page = public_file_page(share, share.files, share.next_cursor)
+    archive_token = create_archive_token(share) if share.file_count else None
+    return PublicShareResponse(
+        locked=False,
+        files=page.files,
+        file_count=share.file_count,
+        next_cursor=page.next_cursor,
+        archive_token=archive_token
+    )
+
+async def fetch_public_share(db: AsyncSession, public_id: str) -> Optional[CachedShare]:
+    result = await db.execute(
+        select(Share.id, Share.expires_at, Share.password_hash).where(Share.public_id == public_id)
+    )
+    share = result.first()
+    if not share:
+        return None
+    rows, next_cursor = await fetch_file_rows(db, share.id, 0, PUBLIC_FILES_PAGE_SIZE)
+    file_count = len(rows)
+    if next_cursor is not None:
+        file_count = await db.scalar(select(func.count(FileRecord.id)).where(FileRecord.share_id == share.id))
+    return CachedShare(
+        id=share.id,
+        public_id=public_id,
+        expires_at=share.expires_at,
+        password_hash=share.password_hash,
+        file_count=file_count,
+        files=tuple(rows),
+        next_cursor=next_cursor
+    )
+
+async def load_public_share(db: AsyncSession, public_id: str) -> CachedShare:
+    share = share_cache.get(public_id)
+    if share is MISSING:
+        generation = share_cache.generation
+        share = await fetch_public_share(db, public_id)
+        share_cache.put(public_id, share, generation)
     
     if not share:
         raise HTTPException(status_code=404, detail="Share not found")
     
     if share.expires_at and share.expires_at < datetime.utcnow():
          raise HTTPException(status_code=410, detail="Link expired")
+    return share
+
+@router.get("/share/{public_id}", response_model=PublicShareResponse, dependencies=[Depends(limit_share_views)])
+async def get_share_status(request: Request, public_id: str, db: AsyncSession = Depends(get_share_read_db)):
+    share = await load_public_share(db, public_id)
+
+    if share.password_hash and has_share_access_grant(request, share):
+        log_event("download", {
+            "event": "share_access",
+            "public_id": public_id,
+            "status": "success_grant"
+        }, request)
+        return unlocked_share_response(share)
 
     if share.password_hash:
         log_event("download", {
@@ -53,38 +193,27 @@ async def get_share_status(request: Request, public_id: str, db: AsyncSession =
         }, request)
         return PublicShareResponse(locked=True)
     
-    # Not locked, return files
-    files = []
-    for f in share.files:
-        token = create_download_token(f.id)
-        files.append(PublicFile(filename=f.filename, token=token))
-
     log_event("download", {
         "event": "share_access",
         "public_id": public_id,
         "status": "success"
     }, request)
 
-    return PublicShareResponse(locked=False, files=files)
+    # Not locked, return files
+    return unlocked_share_response(share)
 
-@router.post("/share/{public_id}/unlock", response_model=PublicShareResponse)
+@router.post("/share/{public_id}/unlock", response_model=PublicShareResponse, dependencies=[Depends(limit_unlocks)])
 async def unlock_share(
     request: Request,
+    response: Response,
     public_id: str, 
     body: ShareUnlockRequest = Body(...),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_share_read_db)
 ):
-    result = await db.execute(select(Share).where(Share.public_id == public_id).options(selectinload(Share.files)))
-    share = result.scalars().first()
-    
-    if not share:
-        raise HTTPException(status_code=404, detail="Share not found")
-    
-    if share.expires_at and share.expires_at < datetime.utcnow():
-        raise HTTPException(status_code=410, detail="Link expired")
+    share = await load_public_share(db, public_id)
 
     if share.password_hash:
-        if not body.password or not verify_password(body.password, share.password_hash):
+        if not body.password or not await verify_password(body.password, share.password_hash):
              log_event("download", {
                  "event": "unlock_attempt",
                  "public_id": public_id,
@@ -98,34 +227,146 @@ async def unlock_share(
         "status": "success"
     }, request)
 
-    files = []
-    for f in share.files:
-        token = create_download_token(f.id)
-        files.append(PublicFile(filename=f.filename, token=token))
+    if share.password_hash:
+        # Lets get_share_status skip the password (and bcrypt) on reloads
+        response.set_cookie(
+            share_access_cookie_name(share.public_id),
+            create_share_access_grant(share),
+            max_age=SHARE_ACCESS_GRANT_MINUTES * 60,
+            httponly=True,
+            samesite="lax",
+            secure=os.getenv("BASE_URL", "").startswith("https://"),
+        )
+
+    return unlocked_share_response(share)
+
+@router.get("/share/{public_id}/files", response_model=PublicFilePage, dependencies=[Depends(limit_share_views)])
+async def list_share_files(
+    request: Request,
+    public_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(PUBLIC_FILES_PAGE_SIZE, ge=1, le=1000),
+    db: AsyncSession = Depends(get_share_read_db)
+):
+    share = await load_public_share(db, public_id)
+    # Password-protected shares need the grant cookie set by unlock_share
+    if share.password_hash and not has_share_access_grant(request, share):
+        raise HTTPException(status_code=401, detail="Share is locked")
+    # A file id handed out as next_cursor: ASCII digits within the int4 id column
+    if cursor is not None and not (cursor.isascii() and cursor.isdecimal() and int(cursor) < 2**31):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    rows, next_cursor = await fetch_file_rows(db, share.id, int(cursor or 0), limit)
+    return public_file_page(share, rows, next_cursor)
+
+def file_etag(file_id: int, key: str, stored: StoredObject) -> str:
+    # Content-addressed blobs never change, so the digest is a strong validator
+    if DIGEST_RE.match(key):
+        return f'"{key}"'
+    # Legacy files: identity plus what would change if the bytes on disk changed
+    basis = f"{file_id}-{stored.size}-{stored.modified.isoformat()}"
+    return f'"{hashlib.sha256(basis.encode()).hexdigest()[:32]}"'
 
-    return PublicShareResponse(locked=False, files=files)
+def accel_redirect_response(filename: str, relative_path: str) -> Response:
+    # nginx serves the body itself (sendfile, ranges, conditional GET); only headers come from here
+    return Response(headers={
+        "X-Accel-Redirect": DOWNLOAD_ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + quote(relative_path),
+        "Content-Type": guess_type(filename)[0] or "application/octet-stream",
+        "Content-Disposition": content_disposition(filename),
+    })
 
-@router.get("/file/{token}")
+@router.api_route("/file/{token}", methods=["GET", "HEAD"], dependencies=[Depends(limit_downloads)])
 async def download_file(request: Request, token: str, db: AsyncSession = Depends(get_db)):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, PUBLIC_TOKEN_SECRET_KEY, algorithms=[ALGORITHM])
         file_id = int(payload.get("sub"))
         token_type = payload.get("type")
         if token_type != "download":
             raise HTTPException(status_code=401, detail="Invalid token type")
-    except JWTError:
+    except (JWTError, TypeError, ValueError):
         raise HTTPException(status_code=401, detail="Invalid or expired download link")
+
+    key = payload.get("key")
+    if key and revocations.covers(payload.get("iat", 0)) and not revocations.is_revoked(payload.get("shr"), file_id):
+        filename = payload.get("name")
+        DOWNLOAD_TOKEN_LOOKUPS.labels("token").inc()
+    else:
+        # Revoked since (or signed before this worker could hear about revocations): ask the database
+        DOWNLOAD_TOKEN_LOOKUPS.labels("database").inc()
+        if revocations.is_revoked(payload.get("shr"), file_id):
+            # A fresh delete, which the replica may not have replayed yet
+            result = await db.execute(select(FileRecord).where(FileRecord.id == file_id))
+        else:
+            async with read_session(None) as read_db:
+                result = await read_db.execute(select(FileRecord).where(FileRecord.id == file_id))
+        file_record = result.scalars().first()
         
-    result = await db.execute(select(FileRecord).where(FileRecord.id == file_id))
-    file_record = result.scalars().first()
+        if not file_record:
+            raise HTTPException(status_code=404, detail="File not found")
+        key = record_key(file_record)
+        filename = file_record.filename
     
-    if not file_record:
+    if request.method == "GET":
+        log_event("download", {
+            "event": "file_download",
+            "filename": filename,
+            "file_id": file_id,
+            "range": request.headers.get("range")
+        }, request)
+
+    try:
+        if DOWNLOAD_ACCEL_REDIRECT_PREFIX:
+            # Backends nginx cannot read (S3) fall through to streaming
+            relative_path = await run_in_threadpool(storage.accel_path, key)
+            if relative_path:
+                return accel_redirect_response(filename, relative_path)
+        stored = await storage.stat(key)
+    except (FileNotFoundError, ValueError):
+        # ValueError: a key that would leave the storage root
         raise HTTPException(status_code=404, detail="File not found")
-    
+
+    return RangedFileResponse(
+        partial(storage.read_range, key, chunk_size=DOWNLOAD_CHUNK_SIZE),
+        size=stored.size,
+        etag=file_etag(file_id, key, stored),
+        filename=filename,
+        last_modified=stored.modified
+    )
+
+@router.get("/zip/{token}", dependencies=[Depends(limit_downloads)])
+async def download_share_archive(request: Request, token: str, db: AsyncSession = Depends(get_db)):
+    # Archive tokens are only minted once get_share_status/unlock_share let the visitor in
+    try:
+        payload = jwt.decode(token, PUBLIC_TOKEN_SECRET_KEY, algorithms=[ALGORITHM])
+        share_id = int(payload.get("sub"))
+        token_type = payload.get("type")
+        if token_type != "archive":
+            raise HTTPException(status_code=401, detail="Invalid token type")
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid or expired download link")
+
+    result = await db.execute(select(Share).where(Share.id == share_id).options(selectinload(Share.files)))
+    share = result.scalars().first()
+
+    if not share:
+        raise HTTPException(status_code=404, detail="Share not found")
+
+    if share.expires_at and share.expires_at < datetime.utcnow():
+        raise HTTPException(status_code=410, detail="Link expired")
+
+    files = sorted(share.files, key=lambda f: f.id)
+    entries = [
+        ZipEntry(arcname=name, key=record_key(f))
+        for f, name in zip(files, unique_arcnames(f.filename for f in files))
+    ]
+
     log_event("download", {
-        "event": "file_download",
-        "filename": file_record.filename,
-        "file_id": file_record.id
+        "event": "archive_download",
+        "public_id": share.public_id,
+        "files": len(entries)
     }, request)
-        
-    return FileResponse(file_record.file_path, filename=file_record.filename)
+
+    return StreamingResponse(
+        count_download(iter_zip(entries, storage, DOWNLOAD_CHUNK_SIZE)),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="share-{share.public_id[:8]}.zip"'}
+    )
@@ -0,0 +1,248 @@
+import os
+import uuid
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, Request, HTTPException, Path
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.postgresql import insert
+from starlette.concurrency import run_in_threadpool
+
+from app.db import get_db
+from app.models import User, FileRecord, Share, UploadSession, UploadPart
+from app.schemas import (
+    ShareResponse, FileResponse, UploadSessionCreate, UploadSessionResponse, UploadPartResponse
+)
+from app.auth import get_current_user
+from app.logging_utils import log_event
+from app.uploads import (
+    IngestedFile, concatenate_files, part_path, remove_session_dir, session_dir, stream_body_to_file,
+    temp_upload_path
+)
+from app.blobs import acquire_blobs, discard_ingest, remove_files
+from app.share_cache import notify_share_changed
+
+router = APIRouter(prefix="/uploads")
+
+UPLOAD_SESSION_TTL_HOURS = int(os.getenv("UPLOAD_SESSION_TTL_HOURS", 24))
+UPLOAD_MAX_PARTS = 10000
+
+def session_response(session: UploadSession, parts) -> UploadSessionResponse:
+    return UploadSessionResponse(
+        upload_id=session.id,
+        filename=session.filename,
+        size=session.size,
+        share_public_id=session.share_public_id,
+        expires_at=session.expires_at,
+        max_parts=UPLOAD_MAX_PARTS,
+        parts=[UploadPartResponse(part_number=p.part_number, size=p.size) for p in parts]
+    )
+
+async def get_owned_session(db: AsyncSession, upload_id: str, user: User, for_update: bool = False) -> UploadSession:
+    query = select(UploadSession).where(UploadSession.id == upload_id, UploadSession.owner_id == user.id)
+    if for_update:
+        query = query.with_for_update()
+    result = await db.execute(query)
+    session = result.scalars().first()
+    if not session or session.expires_at < datetime.utcnow():
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+@router.post("", response_model=UploadSessionResponse)
+async def create_upload_session(
+    data: UploadSessionCreate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    if data.share_public_id is not None:
+        result = await db.execute(
+            select(Share.id).where(Share.public_id == data.share_public_id, Share.owner_id == current_user.id)
+        )
+        if result.scalar() is None:
+            raise HTTPException(status_code=404, detail="Share not found")
+
+    session = UploadSession(
+        owner_id=current_user.id,
+        filename=data.filename,
+        size=data.size,
+        share_public_id=data.share_public_id,
+        expires_at=datetime.utcnow() + timedelta(hours=UPLOAD_SESSION_TTL_HOURS)
+    )
+    db.add(session)
+    await db.commit()
+    os.makedirs(session_dir(session.id), exist_ok=True)
+
+    return session_response(session, [])
+
+@router.get("/{upload_id}", response_model=UploadSessionResponse)
+async def get_upload_session(
+    upload_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    session = await get_owned_session(db, upload_id, current_user)
+    result = await db.execute(
+        select(UploadPart).where(UploadPart.session_id == session.id).order_by(UploadPart.part_number)
+    )
+    return session_response(session, result.scalars().all())
+
+@router.put("/{upload_id}/parts/{part_number}", response_model=UploadPartResponse)
+async def upload_part(
+    request: Request,
+    upload_id: str,
+    part_number: int = Path(..., ge=1, le=UPLOAD_MAX_PARTS),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    session = await get_owned_session(db, upload_id, current_user)
+    # Give the pooled connection back while the body streams in
+    await db.commit()
+
+    os.makedirs(session_dir(session.id), exist_ok=True)
+    # Staged beside the part and only moved into place under the session's row lock, so
+    # parts cannot change while complete_upload_session (which holds that lock) assembles them
+    staged_path = f"{part_path(session.id, part_number)}.{uuid.uuid4().hex}.received"
+    try:
+        size = await stream_body_to_file(request, staged_path)
+    except FileNotFoundError:
+        # The session directory was removed by an abort or complete meanwhile
+        raise HTTPException(status_code=404, detail="Upload session not found")
+
+    try:
+        # Aborted, completed or expired while the body streamed in: 404, and the part goes away
+        session = await get_owned_session(db, upload_id, current_user, for_update=True)
+        await run_in_threadpool(os.replace, staged_path, part_path(session.id, part_number))
+        # Re-sending a part replaces it, which is what makes retries after a failure safe
+        await db.execute(
+            insert(UploadPart)
+            .values(session_id=session.id, part_number=part_number, size=size)
+            .on_conflict_do_update(index_elements=[UploadPart.session_id, UploadPart.part_number], set_={"size": size})
+        )
+        session.expires_at = datetime.utcnow() + timedelta(hours=UPLOAD_SESSION_TTL_HOURS)
+        await db.commit()
+    except BaseException:
+        await run_in_threadpool(remove_files, [staged_path])
+        raise
+
+    return UploadPartResponse(part_number=part_number, size=size)
+
+@router.post("/{upload_id}/complete", response_model=ShareResponse)
+async def complete_upload_session(
+    request: Request,
+    upload_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    session = await get_owned_session(db, upload_id, current_user)
+    result = await db.execute(
+        select(UploadPart.part_number, UploadPart.size)
+        .where(UploadPart.session_id == session.id).order_by(UploadPart.part_number)
+    )
+    parts = result.all()
+
+    received = [p.part_number for p in parts]
+    if not received:
+        raise HTTPException(status_code=400, detail="No parts uploaded")
+    missing = sorted(set(range(1, received[-1] + 1)) - set(received))
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Missing parts: {missing[:20]}")
+    total = sum(p.size for p in parts)
+    if session.size is not None and total != session.size:
+        raise HTTPException(status_code=400, detail=f"Expected {session.size} bytes, received {total}")
+    # Joining the parts can take minutes: do it without holding a connection or the session's lock
+    await db.commit()
+
+    temp_path = temp_upload_path()
+    try:
+        size, digest = await run_in_threadpool(
+            concatenate_files, [part_path(session.id, n) for n in received], temp_path
+        )
+    except FileNotFoundError:
+        # Completed (or expired) by another request meanwhile
+        await run_in_threadpool(remove_files, [temp_path])
+        raise HTTPException(status_code=409, detail="Upload session changed while completing, retry")
+    except BaseException:
+        await run_in_threadpool(remove_files, [temp_path])
+        raise
+    assembled = IngestedFile(session.filename, temp_path, size, digest)
+
+    try:
+        # Row lock so two concurrent completes cannot both finalize the session
+        session = await get_owned_session(db, upload_id, current_user, for_update=True)
+        result = await db.execute(
+            select(UploadPart.part_number, UploadPart.size)
+            .where(UploadPart.session_id == session.id).order_by(UploadPart.part_number)
+        )
+        if result.all() != parts or size != total:
+            raise HTTPException(status_code=409, detail="Upload session changed while completing, retry")
+
+        if session.share_public_id is not None:
+            result = await db.execute(
+                select(Share).where(Share.public_id == session.share_public_id, Share.owner_id == current_user.id)
+            )
+            share = result.scalars().first()
+            if not share:
+                raise HTTPException(status_code=404, detail="Share not found")
+        else:
+            # Create a new Share with default 30-minute expiration
+            share = Share(
+                owner_id=current_user.id,
+                expires_at=datetime.utcnow() + timedelta(minutes=30)
+            )
+            db.add(share)
+            await db.flush() # get ID
+
+        await acquire_blobs(db, [assembled])
+        db_file = FileRecord(
+            filename=session.filename,
+            blob_digest=assembled.digest,
+            share_id=share.id
+        )
+        db.add(db_file)
+        await db.delete(session)
+        await notify_share_changed(db, share.public_id)
+        await db.commit()
+    except BaseException:
+        await discard_ingest(db, [assembled])
+        raise
+    await run_in_threadpool(remove_session_dir, session.id)
+
+    log_event("upload", {
+        "username": current_user.username,
+        "share_id": share.public_id,
+        "files": [session.filename],
+        "bytes": total,
+        "parts": len(parts),
+        "upload_id": session.id
+    }, request)
+
+    result = await db.execute(
+        select(FileRecord).where(FileRecord.share_id == share.id).order_by(FileRecord.id)
+    )
+    files = result.scalars().all()
+
+    base_url = os.getenv("BASE_URL", "http://localhost:3000")
+    if not base_url.endswith("/"):
+        base_url += "/"
+
+    return ShareResponse(
+        public_id=share.public_id,
+        share_link=f"{base_url}download/{share.public_id}",
+        files=[FileResponse(id=f.id, filename=f.filename) for f in files],
+        expires_at=share.expires_at,
+        password_protected=bool(share.password_hash),
+        created_at=share.created_at,
+        is_shared=share.is_shared
+    )
+
+@router.delete("/{upload_id}")
+async def abort_upload_session(
+    upload_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    session = await get_owned_session(db, upload_id, current_user)
+    await db.execute(delete(UploadSession).where(UploadSession.id == session.id))
+    await db.commit()
+    await run_in_threadpool(remove_session_dir, session.id)
+
+    return {"message": "Upload session aborted"}
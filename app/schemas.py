@@ -50,6 +50,42 @@ class ShareListItem(BaseModel):
     created_at: Optional[datetime]
     is_shared: bool
 
+class ShareListPage(BaseModel):
+    items: List[ShareListItem]
+    next_cursor: Optional[str] = None # Pass as ?cursor= to fetch the next page; None on the last page
+
 class ShareUpdate(BaseModel):
     password: Optional[str] = None
     expires_minutes: Optional[int] = None
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: Optional[int] = None
+    share_public_id: Optional[str] = None
+
+class UploadPartResponse(BaseModel):
+    part_number: int
+    size: int
+
+class UploadSessionResponse(BaseModel):
+    upload_id: str
+    filename: str
+    size: Optional[int]
+    share_public_id: Optional[str]
+    expires_at: datetime
+    max_parts: int
+    parts: List[UploadPartResponse]
+
+class BlobCheckRequest(BaseModel):
+    digests: List[str]
+
+class BlobCheckResponse(BaseModel):
+    present: List[str]
+    missing: List[str]
+
+class BlobFileRef(BaseModel):
+    digest: str
+    filename: str
+
+class BlobAttachRequest(BaseModel):
+    files: List[BlobFileRef]
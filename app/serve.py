@@ -0,0 +1,115 @@
+"""Pre-fork server for multi-core deployments.
+
+    python -m app.serve
+
+Runs the database migrations once, imports the app once, then forks
+WEB_CONCURRENCY workers that all accept on the same listening socket. Workers
+inherit the imported modules (sharing their memory pages) instead of each
+importing everything again, as ``uvicorn --workers`` does. The parent restarts
+workers that die and passes SIGTERM/SIGINT on for a graceful shutdown.
+"""
+import os
+import shutil
+import signal
+import sys
+import time
+
+import uvicorn
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", 8000))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+# Disable when migrations are run separately (e.g. a release step before rolling out replicas)
+RUN_MIGRATIONS = os.getenv("RUN_MIGRATIONS", "true").lower() == "true"
+# Seconds workers get to finish open requests after SIGTERM before they are killed
+GRACEFUL_TIMEOUT = float(os.getenv("GRACEFUL_TIMEOUT", 30))
+
+_RESTART_DELAY_SECONDS = 1
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_migrations():
+    from alembic import command
+    from alembic.config import Config
+    command.upgrade(Config(os.path.join(_REPO_ROOT, "alembic.ini")), "head")
+
+
+def reset_metrics_dir():
+    # Files left by a previous run would be added to this run's metrics
+    directory = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def _start_worker(config: uvicorn.Config, sockets) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+    # Child: uvicorn installs its own SIGINT/SIGTERM handlers once it starts serving
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    try:
+        uvicorn.Server(config).run(sockets=sockets)
+    finally:
+        os._exit(0)
+
+
+def _supervise(config: uvicorn.Config, sockets, count: int):
+    from app.metrics import mark_worker_dead
+
+    stopping = []
+    signal.signal(signal.SIGINT, lambda *_: stopping.append(True))
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+
+    workers = {_start_worker(config, sockets) for _ in range(count)}
+    print(f"Serving on {config.host}:{config.port} with {count} workers: {sorted(workers)}", flush=True)
+    while not stopping:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            time.sleep(0.5)
+            continue
+        workers.discard(pid)
+        mark_worker_dead(pid)
+        if stopping:
+            break
+        print(f"Worker {pid} exited with status {status}; starting a new one", flush=True)
+        time.sleep(_RESTART_DELAY_SECONDS)
+        workers.add(_start_worker(config, sockets))
+
+    for pid in workers:
+        os.kill(pid, signal.SIGTERM)
+    deadline = time.monotonic() + GRACEFUL_TIMEOUT
+    while workers:
+        pid, _ = os.waitpid(-1, os.WNOHANG)
+        if pid:
+            workers.discard(pid)
+            mark_worker_dead(pid)
+        elif time.monotonic() > deadline:
+            for pid in workers:
+                os.kill(pid, signal.SIGKILL)
+            deadline = float("inf")
+        else:
+            time.sleep(0.1)
+    mark_worker_dead()
+
+
+def main():
+    # First: anything importing app.metrics (the migrations do) opens files in this directory
+    reset_metrics_dir()
+    if RUN_MIGRATIONS:
+        run_migrations()
+
+    config = uvicorn.Config("app.main:app", host=HOST, port=PORT, proxy_headers=True)
+    # Imported here, before forking, so every worker shares it
+    config.load()
+    sockets = [config.bind_socket()]
+    if WEB_CONCURRENCY <= 1:
+        uvicorn.Server(config).run(sockets=sockets)
+    else:
+        _supervise(config, sockets, WEB_CONCURRENCY)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
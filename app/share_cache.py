@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.metrics import SHARE_CACHE_HITS, SHARE_CACHE_MISSES, SHARE_CACHE_NOTIFICATIONS
+from app.notify import publish, subscribe
+from app.replica import recent_writes
+
+# Changes are pushed to every worker over LISTEN/NOTIFY; the TTL only matters if that link is down
+SHARE_CACHE_TTL_SECONDS = float(os.getenv("SHARE_CACHE_TTL_SECONDS", 60))
+# Unknown public ids are remembered (as "not found") for this long
+SHARE_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("SHARE_CACHE_NEGATIVE_TTL_SECONDS", 10))
+SHARE_CACHE_SIZE = int(os.getenv("SHARE_CACHE_SIZE", 10000))
+
+SHARE_CACHE_CHANNEL = "share_cache"
+
+MISSING = object()
+
+
+@dataclass(frozen=True)
+class CachedShare:
+    """What the public share pages need to know about a share."""
+    id: int
+    public_id: str
+    expires_at: Optional[datetime]
+    password_hash: Optional[str]
+    file_count: int
+    # (id, filename, storage key) of the first page of files, and the cursor after it
+    files: Tuple[Tuple[int, str, str], ...]
+    next_cursor: Optional[str]
+
+
+class ShareCache:
+    """Bounded LRU of CachedShare keyed by public id, with a TTL.
+
+    ``None`` is cached for ids that do not exist. ``generation`` works as in
+    UserCache: a load that started before an invalidation is not stored.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.generation = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, public_id: str):
+        """The cached share, ``None`` for a known-missing id, or MISSING."""
+        with self._lock:
+            entry = self._entries.get(public_id)
+            if entry is None:
+                SHARE_CACHE_MISSES.inc()
+                return MISSING
+            expires, share = entry
+            if expires < time.monotonic():
+                del self._entries[public_id]
+                SHARE_CACHE_MISSES.inc()
+                return MISSING
+            self._entries.move_to_end(public_id)
+            SHARE_CACHE_HITS.labels("found" if share is not None else "not_found").inc()
+            return share
+
+    def put(self, public_id: str, share: Optional[CachedShare], generation: int):
+        with self._lock:
+            if generation != self.generation:
+                return
+            ttl = self.ttl if share is not None else self.negative_ttl
+            self._entries[public_id] = (time.monotonic() + ttl, share)
+            self._entries.move_to_end(public_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *public_ids: str):
+        """Forget the given shares, or all of them if none are given."""
+        with self._lock:
+            self.generation += 1
+            if not public_ids:
+                self._entries.clear()
+            for public_id in public_ids:
+                self._entries.pop(public_id, None)
+
+
+share_cache = ShareCache(SHARE_CACHE_SIZE, SHARE_CACHE_TTL_SECONDS, SHARE_CACHE_NEGATIVE_TTL_SECONDS)
+
+
+async def notify_share_changed(db: AsyncSession, *public_ids: str):
+    """Invalidate ``public_ids`` in every worker once ``db`` commits. Call before the commit."""
+    await publish(db, SHARE_CACHE_CHANNEL, *public_ids)
+
+
+def _on_share_changed(public_ids: List[str]):
+    SHARE_CACHE_NOTIFICATIONS.inc()
+    share_cache.invalidate(*public_ids)
+    # Until the replica has caught up, these shares are read from the primary
+    recent_writes.mark(*(f"s:{public_id}" for public_id in public_ids))
+
+
+# Whatever changed while nobody was listening is unknown, so start over on both edges
+subscribe(
+    SHARE_CACHE_CHANNEL,
+    _on_share_changed,
+    on_connect=share_cache.invalidate,
+    on_disconnect=share_cache.invalidate,
+)
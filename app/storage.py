@@ -0,0 +1,286 @@
+import os
+import re
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from functools import partial
+from datetime import datetime
+from typing import AsyncIterator, BinaryIO, Iterable, List, Optional, Tuple
+
+import anyio
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from app.ranges import local_file_reader
+from app.uploads import FILES_DIR
+
+# local | s3
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+
+# Directory levels of two hex characters above each blob: ab/cd/abcd...
+STORAGE_SHARD_DEPTH = int(os.getenv("STORAGE_SHARD_DEPTH", 2))
+
+# Threads unlinking files at once when a large batch is deleted (share expiry)
+STORAGE_DELETE_CONCURRENCY = int(os.getenv("STORAGE_DELETE_CONCURRENCY", 4))
+
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_PREFIX = os.getenv("S3_PREFIX", "")
+# Point at MinIO (or any other S3-compatible server) for local testing
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_REGION = os.getenv("S3_REGION") or None
+
+DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+@dataclass
+class StoredObject:
+    size: int
+    modified: datetime
+
+
+def record_key(file_record) -> str:
+    """Storage key of a FileRecord: its blob digest, or for legacy uploads the
+    path the file was written to, relative to FILES_DIR."""
+    if file_record.blob_digest:
+        return file_record.blob_digest
+    return os.path.relpath(file_record.file_path, FILES_DIR).replace(os.sep, "/")
+
+
+def sharded_name(key: str, depth: int = STORAGE_SHARD_DEPTH) -> str:
+    shards = [key[i * 2:i * 2 + 2] for i in range(depth)]
+    return "/".join(shards + [key])
+
+
+class StorageBackend(ABC):
+    """Where file bodies live. Keys are blob digests, or for files uploaded
+    before the blob store, their path relative to FILES_DIR.
+
+    Async methods may be awaited from request handlers; ``open_sync`` blocks
+    and is meant for worker threads (e.g. the ZIP streamer).
+    """
+
+    # Keys handed to one blocking ``_delete_many`` call
+    delete_batch_size = 64
+
+    @abstractmethod
+    async def put(self, key: str, source_path: str):
+        """Move the local file ``source_path`` into storage under ``key``."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def stat(self, key: str) -> StoredObject:
+        """Raises FileNotFoundError if ``key`` is not stored."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def read_range(self, key: str, start: int, end: int, chunk_size: int) -> AsyncIterator[bytes]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def open_sync(self, key: str) -> Tuple[BinaryIO, StoredObject]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _delete_many(self, keys: List[str]):
+        raise NotImplementedError
+
+    async def delete_many(self, keys: Iterable[str]):
+        keys = list(keys)
+        batches = [keys[i:i + self.delete_batch_size] for i in range(0, len(keys), self.delete_batch_size)]
+        if len(batches) <= 1:
+            if batches:
+                await run_in_threadpool(self._delete_many, batches[0])
+            return
+        limiter = anyio.CapacityLimiter(STORAGE_DELETE_CONCURRENCY)
+        async with anyio.create_task_group() as task_group:
+            for batch in batches:
+                task_group.start_soon(partial(anyio.to_thread.run_sync, self._delete_many, batch, limiter=limiter))
+
+    def accel_path(self, key: str) -> Optional[str]:
+        """Path below the storage root for X-Accel-Redirect, or None if nginx cannot read it."""
+        return None
+
+
+class LocalStorage(StorageBackend):
+    """Blobs in a sharded directory tree under ``root`` so no directory grows
+    past a few thousand entries."""
+
+    def __init__(self, root: str, shard_depth: int = STORAGE_SHARD_DEPTH):
+        self.root = root
+        self.shard_depth = shard_depth
+
+    def relative_path(self, key: str) -> str:
+        if DIGEST_RE.match(key):
+            return sharded_name(key, self.shard_depth)
+        relative = os.path.normpath(key).replace(os.sep, "/")
+        if relative.startswith("../") or relative == ".." or os.path.isabs(relative):
+            raise ValueError(f"Storage key escapes the storage root: {key}")
+        return relative
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, self.relative_path(key))
+
+    def legacy_path(self, key: str) -> Optional[str]:
+        # Flat blobs/<digest> layout used before sharding; see app/storage_migrate.py
+        return os.path.join(self.root, "blobs", key) if DIGEST_RE.match(key) else None
+
+    def resolve(self, key: str) -> str:
+        """Current on-disk location of ``key``. Blocking.
+
+        The migration tool links a blob into the sharded tree before unlinking
+        the flat copy, so checking sharded, flat, sharded again never misses a
+        blob that is being moved.
+        """
+        path = self.path(key)
+        legacy = self.legacy_path(key)
+        for candidate in (path, legacy, path):
+            if candidate and os.path.exists(candidate):
+                return candidate
+        raise FileNotFoundError(path)
+
+    def _put(self, key: str, source_path: str):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source_path, path)
+
+    async def put(self, key: str, source_path: str):
+        await run_in_threadpool(self._put, key, source_path)
+
+    async def exists(self, key: str) -> bool:
+        try:
+            await run_in_threadpool(self.resolve, key)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _stat(self, key: str) -> StoredObject:
+        stat_result = os.stat(self.resolve(key))
+        return StoredObject(stat_result.st_size, datetime.utcfromtimestamp(stat_result.st_mtime))
+
+    async def stat(self, key: str) -> StoredObject:
+        return await run_in_threadpool(self._stat, key)
+
+    async def read_range(self, key: str, start: int, end: int, chunk_size: int) -> AsyncIterator[bytes]:
+        path = await run_in_threadpool(self.resolve, key)
+        async for chunk in local_file_reader(path, chunk_size)(start, end):
+            yield chunk
+
+    def open_sync(self, key: str) -> Tuple[BinaryIO, StoredObject]:
+        f = open(self.resolve(key), "rb")
+        stat_result = os.fstat(f.fileno())
+        return f, StoredObject(stat_result.st_size, datetime.utcfromtimestamp(stat_result.st_mtime))
+
+    def _delete_many(self, keys: List[str]):
+        for key in keys:
+            for path in (self.path(key), self.legacy_path(key)):
+                if not path:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except Exception as e:
+                    print(f"Error deleting file {path}: {e}")
+
+    def accel_path(self, key: str) -> Optional[str]:
+        try:
+            return os.path.relpath(self.resolve(key), self.root).replace(os.sep, "/")
+        except FileNotFoundError:
+            return None
+
+
+class S3Storage(StorageBackend):
+    """Any S3-compatible object store. Uses the same shard prefixes as the
+    local layout, which also spreads request load across key prefixes."""
+
+    # DeleteObjects accepts up to 1000 keys per request
+    delete_batch_size = 1000
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None, region: Optional[str] = None):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self._client_error = ClientError
+
+    def object_key(self, key: str) -> str:
+        if DIGEST_RE.match(key):
+            return self.prefix + sharded_name(key)
+        return self.prefix + "legacy/" + key.lstrip("/")
+
+    def _is_missing(self, exc) -> bool:
+        return exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def _put(self, key: str, source_path: str):
+        # upload_file switches to parallel multipart uploads for large files
+        self.client.upload_file(source_path, self.bucket, self.object_key(key))
+        os.remove(source_path)
+
+    async def put(self, key: str, source_path: str):
+        await run_in_threadpool(self._put, key, source_path)
+
+    def _stat(self, key: str) -> StoredObject:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+        except self._client_error as e:
+            if self._is_missing(e):
+                raise FileNotFoundError(key)
+            raise
+        return StoredObject(head["ContentLength"], head["LastModified"].replace(tzinfo=None))
+
+    async def stat(self, key: str) -> StoredObject:
+        return await run_in_threadpool(self._stat, key)
+
+    async def exists(self, key: str) -> bool:
+        try:
+            await self.stat(key)
+            return True
+        except FileNotFoundError:
+            return False
+
+    async def read_range(self, key: str, start: int, end: int, chunk_size: int) -> AsyncIterator[bytes]:
+        if end <= start:
+            return
+        response = await run_in_threadpool(
+            self.client.get_object, Bucket=self.bucket, Key=self.object_key(key), Range=f"bytes={start}-{end - 1}"
+        )
+        body = response["Body"]
+        try:
+            async for chunk in iterate_in_threadpool(body.iter_chunks(chunk_size)):
+                yield chunk
+        finally:
+            body.close()
+
+    def open_sync(self, key: str) -> Tuple[BinaryIO, StoredObject]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))
+        except self._client_error as e:
+            if self._is_missing(e):
+                raise FileNotFoundError(key)
+            raise
+        return response["Body"], StoredObject(response["ContentLength"], response["LastModified"].replace(tzinfo=None))
+
+    def _delete_many(self, keys: List[str]):
+        objects = [{"Key": self.object_key(k)} for k in keys]
+        result = self.client.delete_objects(Bucket=self.bucket, Delete={"Objects": objects, "Quiet": True})
+        for error in result.get("Errors", []):
+            print(f"Error deleting object {error.get('Key')}: {error.get('Message')}")
+
+
+def create_storage() -> StorageBackend:
+    if STORAGE_BACKEND == "local":
+        return LocalStorage(FILES_DIR)
+    if STORAGE_BACKEND == "s3":
+        return S3Storage(S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL, S3_REGION)
+    raise RuntimeError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+
+
+storage = create_storage()
@@ -0,0 +1,228 @@
+"""Re-lay files on local disk into the sharded blob layout, online.
+
+    python -m app.storage_migrate [--dry-run] [--batch-size N] [--copy-to-backend]
+
+1. Blobs in the old flat ``FILES_DIR/blobs/<digest>`` directory are renamed
+   into ``FILES_DIR/ab/cd/<digest>``. Each batch holds a share lock on its blob
+   rows, so no upload or delete of the same digest can interleave; readers
+   find the file either way (see LocalStorage.resolve).
+2. Files uploaded before the blob store (one file per FileRecord) are hashed
+   and turned into blobs. The blob is staged next to the old file and the
+   row is switched in its own transaction; the old file is only unlinked
+   after the commit, so downloads in flight keep working.
+3. With ``--copy-to-backend`` every blob is then copied into the backend
+   selected by STORAGE_BACKEND (e.g. s3), skipping ones already there. Local
+   files are left alone: run once, switch the app over, run again to pick up
+   blobs uploaded in between.
+
+Safe to interrupt and re-run.
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import shutil
+import uuid
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from starlette.concurrency import run_in_threadpool
+
+from app.db import AsyncSessionLocal
+from app.models import Blob, FileRecord
+from app.revocations import revoke_downloads
+from app.storage import DIGEST_RE, LocalStorage, record_key, storage
+from app.uploads import FILES_DIR, UPLOAD_TMP_DIR
+
+local = LocalStorage(FILES_DIR)
+
+
+def _hash_file(path: str) -> tuple:
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            sha256.update(chunk)
+            size += len(chunk)
+    return size, sha256.hexdigest()
+
+
+def _stage_copy(path: str) -> str:
+    """Second name for ``path`` in the upload temp dir, ready to be moved into storage."""
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    staged = os.path.join(UPLOAD_TMP_DIR, f"migrate-{uuid.uuid4().hex}")
+    try:
+        os.link(path, staged)
+    except OSError:
+        shutil.copyfile(path, staged)
+    return staged
+
+
+def _flat_blob_batch(limit: int, skip: set) -> list:
+    # Rescanned for every batch: the directory can hold millions of entries and shrinks as we go
+    flat_dir = os.path.join(FILES_DIR, "blobs")
+    if not os.path.isdir(flat_dir):
+        return []
+    batch = []
+    with os.scandir(flat_dir) as entries:
+        for entry in entries:
+            if DIGEST_RE.match(entry.name) and entry.name not in skip:
+                batch.append(entry.name)
+                if len(batch) >= limit:
+                    break
+    return batch
+
+
+def _move_flat_blob(digest: str) -> bool:
+    flat = local.legacy_path(digest)
+    sharded = local.path(digest)
+    if not os.path.exists(flat):
+        return False
+    os.makedirs(os.path.dirname(sharded), exist_ok=True)
+    os.replace(flat, sharded)
+    return True
+
+
+async def relayout_flat_blobs(batch_size: int, dry_run: bool) -> int:
+    moved = 0
+    skip = set()
+    while True:
+        batch = await run_in_threadpool(_flat_blob_batch, batch_size, skip)
+        if not batch:
+            return moved
+        if dry_run:
+            moved += len(batch)
+            skip.update(batch)
+            continue
+        async with AsyncSessionLocal() as db:
+            # FOR SHARE blocks refcount changes (and so unlinks) on these digests until commit
+            result = await db.execute(select(Blob.digest).where(Blob.digest.in_(batch)).with_for_update(read=True))
+            live = set(result.scalars().all())
+            for digest in batch:
+                if digest not in live:
+                    print(f"Skipping unreferenced blob {digest}")
+                    skip.add(digest)
+                    continue
+                if await run_in_threadpool(_move_flat_blob, digest):
+                    moved += 1
+            await db.commit()
+
+
+async def convert_legacy_file(db, record_id: int, dry_run: bool) -> bool:
+    result = await db.execute(
+        select(FileRecord)
+        .where(FileRecord.id == record_id, FileRecord.blob_digest == None)
+        .with_for_update(skip_locked=True)
+    )
+    record = result.scalars().first()
+    if not record or not record.file_path:
+        await db.rollback()
+        return False
+    path = local.path(record_key(record))
+    try:
+        size, digest = await run_in_threadpool(_hash_file, path)
+    except FileNotFoundError:
+        print(f"Skipping file {record.id}: {path} is missing")
+        await db.rollback()
+        return False
+    if dry_run:
+        await db.rollback()
+        return True
+
+    staged = await run_in_threadpool(_stage_copy, path)
+    try:
+        result = await db.execute(
+            insert(Blob)
+            .values(digest=digest, size=size, refcount=1)
+            .on_conflict_do_update(index_elements=[Blob.digest], set_={"refcount": Blob.refcount + 1})
+            .returning(Blob.refcount)
+        )
+        if result.scalar() == 1 or not await local.exists(digest):
+            await local.put(digest, staged)
+        else:
+            await run_in_threadpool(os.remove, staged)
+        record.blob_digest = digest
+        record.file_path = None
+        # Outstanding download links carry the old path; send them back to the database
+        await revoke_downloads(db, file_ids=[record.id])
+        await db.commit()
+    except BaseException:
+        if os.path.exists(staged):
+            os.remove(staged)
+        await db.rollback()
+        raise
+    await run_in_threadpool(os.remove, path)
+    return True
+
+
+async def convert_legacy_files(batch_size: int, dry_run: bool) -> int:
+    converted = 0
+    last_id = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(FileRecord.id)
+                .where(FileRecord.blob_digest == None, FileRecord.file_path != None, FileRecord.id > last_id)
+                .order_by(FileRecord.id)
+                .limit(batch_size)
+            )
+            ids = result.scalars().all()
+            if not ids:
+                return converted
+            for record_id in ids:
+                if await convert_legacy_file(db, record_id, dry_run):
+                    converted += 1
+            last_id = ids[-1]
+
+
+def _copy_blob(digest: str) -> str:
+    return _stage_copy(local.resolve(digest))
+
+
+async def copy_to_backend(batch_size: int, dry_run: bool) -> int:
+    copied = 0
+    last_digest = ""
+    while True:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Blob.digest).where(Blob.digest > last_digest).order_by(Blob.digest).limit(batch_size)
+            )
+            digests = result.scalars().all()
+        if not digests:
+            return copied
+        for digest in digests:
+            if await storage.exists(digest):
+                continue
+            if dry_run:
+                copied += 1
+                continue
+            try:
+                staged = await run_in_threadpool(_copy_blob, digest)
+            except FileNotFoundError:
+                print(f"Skipping blob {digest}: not on local disk")
+                continue
+            await storage.put(digest, staged)
+            copied += 1
+        last_digest = digests[-1]
+
+
+async def main(batch_size: int, dry_run: bool, copy: bool):
+    moved = await relayout_flat_blobs(batch_size, dry_run)
+    print(f"Moved {moved} blobs into the sharded layout.")
+    converted = await convert_legacy_files(batch_size, dry_run)
+    print(f"Converted {converted} legacy files into blobs.")
+    if copy:
+        if isinstance(storage, LocalStorage) and os.path.abspath(storage.root) == os.path.abspath(local.root):
+            print("STORAGE_BACKEND is the local store; nothing to copy.")
+            return
+        copied = await copy_to_backend(batch_size, dry_run)
+        print(f"Copied {copied} blobs to the {type(storage).__name__} backend.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move stored files into the sharded blob layout.")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without touching anything")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--copy-to-backend", action="store_true", help="also copy every blob into STORAGE_BACKEND")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size, args.dry_run, args.copy_to_backend))
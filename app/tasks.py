@@ -1,54 +1,131 @@
-import asyncio
 import os
-from datetime import datetime
-from sqlalchemy import select
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import select, delete, func
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from starlette.concurrency import run_in_threadpool
 
 from app.db import AsyncSessionLocal
-from app.models import Share
-
-async def cleanup_expired_files():
-    while True:
-        try:
-            async with AsyncSessionLocal() as db:
-                now = datetime.utcnow()
-                # Eager load files to delete them
-                result = await db.execute(
-                    select(Share)
-                    .where(Share.expires_at != None)
-                    .where(Share.expires_at < now)
-                    .options(selectinload(Share.files))
-                )
-                expired_shares = result.scalars().unique().all()
-                
-                if expired_shares:
-                    print(f"[{now}] Found {len(expired_shares)} expired shares to clean up.")
-                
-                for share in expired_shares:
-                    print(f"Processing cleanup for share: {share.public_id}")
-                    for file_record in share.files:
-                        path_to_delete = file_record.file_path
-                        if path_to_delete and os.path.exists(path_to_delete):
-                            try:
-                                os.remove(path_to_delete)
-                                print(f"  - Physically deleted file: {path_to_delete}")
-                            except Exception as e:
-                                print(f"  - FAILED to delete file {path_to_delete}: {e}")
-                        else:
-                            print(f"  - File already gone or path missing: {path_to_delete}")
-                    
-                    # Delete the share (cascade deletes file records in DB)
-                    await db.delete(share)
-                    print(f"  - Deleted share record {share.public_id} from database")
-                
-                if expired_shares:
-                    await db.commit()
-                    print(f"[{now}] Cleanup committed successfully.")
-                    
-        except Exception as e:
-            print(f"Error in cleanup task: {e}")
-            import traceback
-            traceback.print_exc()
-        
-        await asyncio.sleep(60)
+from app.models import Share, FileRecord, UploadSession
+from app.uploads import remove_session_dir
+from app.blobs import delete_released, purge_unreferenced_blobs, release_files
+from app.share_cache import notify_share_changed
+from app.revocations import revoke_downloads
+from app.jobs import register_job, run_job_soon
+from app.metrics import EXPIRY_BACKLOG, EXPIRY_RECLAIMED_BYTES, EXPIRY_RECLAIMED_FILES, EXPIRY_RECLAIMED_SHARES
+
+# Shares deleted per transaction; keeps row locks and each commit small
+EXPIRY_BATCH_SIZE = int(os.getenv("EXPIRY_BATCH_SIZE", 200))
+
+# Longest between expiry runs even if nothing is due, so shares shortened by
+# anything that bypasses schedule_expiry() are still picked up
+EXPIRY_MAX_SLEEP_SECONDS = float(os.getenv("EXPIRY_MAX_SLEEP_SECONDS", 300))
+
+# How often abandoned resumable upload sessions are garbage-collected
+UPLOAD_SESSION_GC_SECONDS = float(os.getenv("UPLOAD_SESSION_GC_SECONDS", 300))
+
+# How often blobs left without references are deleted; normally that happens right after
+# the commit that released them, this catches workers that died in between
+BLOB_GC_SECONDS = float(os.getenv("BLOB_GC_SECONDS", 3600))
+
+EXPIRY_JOB = "expire_shares"
+UPLOAD_SESSION_GC_JOB = "purge_upload_sessions"
+BLOB_GC_JOB = "purge_unreferenced_blobs"
+
+def schedule_expiry(expires_at: Optional[datetime]):
+    """Run the expiry job early if ``expires_at`` is before its next planned run."""
+    if expires_at is not None:
+        run_job_soon(EXPIRY_JOB, expires_at)
+
+async def purge_stale_upload_sessions(db: AsyncSession, now: datetime):
+    # Upload sessions that were never completed or aborted; parts rows go with them (ON DELETE CASCADE)
+    result = await db.execute(
+        delete(UploadSession)
+        .where(UploadSession.expires_at < now)
+        .returning(UploadSession.id)
+    )
+    stale_ids = result.scalars().all()
+    await db.commit()
+
+    for upload_id in stale_ids:
+        await run_in_threadpool(remove_session_dir, upload_id)
+    if stale_ids:
+        print(f"[{now}] Removed {len(stale_ids)} stale upload sessions.")
+
+async def expire_share_batch(db: AsyncSession, now: datetime) -> int:
+    """Delete up to EXPIRY_BATCH_SIZE expired shares, their files and any blobs
+    left unreferenced, in one transaction. Returns the number of shares."""
+    # SKIP LOCKED lets several workers drain the backlog without waiting on each other
+    result = await db.execute(
+        select(Share.id, Share.public_id)
+        .where(Share.expires_at < now)
+        .order_by(Share.expires_at)
+        .limit(EXPIRY_BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+    )
+    expired = result.all()
+    share_ids = [share_id for share_id, _ in expired]
+    if not share_ids:
+        await db.rollback()
+        return 0
+
+    result = await db.execute(
+        delete(FileRecord)
+        .where(FileRecord.share_id.in_(share_ids))
+        .returning(FileRecord.file_path, FileRecord.blob_digest)
+        .execution_options(synchronize_session=False)
+    )
+    file_rows = result.all()
+    await db.execute(
+        delete(Share).where(Share.id.in_(share_ids)).execution_options(synchronize_session=False)
+    )
+    # Blobs are only unlinked once no other share references them
+    released = await release_files(db, file_rows)
+    reclaimed_bytes = released.bytes_freed
+    public_ids = [public_id for _, public_id in expired]
+    await notify_share_changed(db, *public_ids)
+    await revoke_downloads(db, share_ids=public_ids)
+    await db.commit()
+    # Only now: had the commit failed, every share in the batch would still need its files
+    await delete_released(released)
+
+    EXPIRY_RECLAIMED_SHARES.inc(len(share_ids))
+    EXPIRY_RECLAIMED_FILES.inc(len(file_rows))
+    EXPIRY_RECLAIMED_BYTES.inc(reclaimed_bytes)
+    print(f"[{now}] Deleted {len(share_ids)} expired shares ({len(file_rows)} files, {reclaimed_bytes} bytes freed)")
+    return len(share_ids)
+
+async def run_expiry(db: AsyncSession, now: datetime) -> Optional[datetime]:
+    """Drain every share expired as of ``now``; returns when the next one expires."""
+    backlog = await db.scalar(select(func.count()).select_from(Share).where(Share.expires_at < now))
+    EXPIRY_BACKLOG.set(backlog)
+    while backlog > 0:
+        deleted = await expire_share_batch(db, now)
+        backlog = max(backlog - deleted, 0)
+        EXPIRY_BACKLOG.set(backlog)
+        if deleted < EXPIRY_BATCH_SIZE:
+            break
+
+    next_expiry = await db.scalar(select(func.min(Share.expires_at)).where(Share.expires_at >= now))
+    await db.commit()
+    return next_expiry
+
+async def expire_shares(now: datetime) -> datetime:
+    async with AsyncSessionLocal() as db:
+        next_expiry = await run_expiry(db, now)
+    next_run = now + timedelta(seconds=EXPIRY_MAX_SLEEP_SECONDS)
+    return min(next_expiry, next_run) if next_expiry is not None else next_run
+
+async def purge_upload_sessions(now: datetime) -> None:
+    async with AsyncSessionLocal() as db:
+        await purge_stale_upload_sessions(db, now)
+
+async def purge_blobs(now: datetime) -> None:
+    async with AsyncSessionLocal() as db:
+        purged = await purge_unreferenced_blobs(db)
+    if purged:
+        print(f"[{now}] Removed {purged} unreferenced blobs.")
+
+register_job(EXPIRY_JOB, expire_shares, every=EXPIRY_MAX_SLEEP_SECONDS)
+register_job(UPLOAD_SESSION_GC_JOB, purge_upload_sessions, every=UPLOAD_SESSION_GC_SECONDS)
+register_job(BLOB_GC_JOB, purge_blobs, every=BLOB_GC_SECONDS)
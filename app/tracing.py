@@ -0,0 +1,201 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from jose import JWTError, jwt
+from opentelemetry import trace
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter
+from opentelemetry.sdk.trace.sampling import (
+    ALWAYS_OFF, Decision, ParentBased, Sampler, SamplingResult, TraceIdRatioBased
+)
+from opentelemetry.trace import Span, StatusCode
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# jaeger (Thrift over HTTP, OTEL_EXPORTER_JAEGER_ENDPOINT), otlp (HTTP, OTEL_EXPORTER_OTLP_ENDPOINT),
+# console (stdout) or none (no spans are recorded at all)
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "jaeger")
+TRACING_ENABLED = TRACE_EXPORTER != "none"
+# Share of new traces that are exported; requests that arrive with a parent follow its decision
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", 1.0))
+# Traces left out by the ratio are still exported when their root span took at least this
+# long, or when any span failed; both need every span to be recorded. 0 / false disables.
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", 1000))
+TRACE_KEEP_ERRORS = os.getenv("TRACE_KEEP_ERRORS", "true").lower() == "true"
+# Append trace context to every SQL statement as a comment (visible in pg_stat_activity)
+TRACE_SQL_COMMENTER = os.getenv("TRACE_SQL_COMMENTER", "true").lower() == "true"
+
+# Bounds on what the slow/error rule holds in memory while traces are still running
+_MAX_PENDING_TRACES = 10000
+_MAX_SPANS_PER_TRACE = 512
+
+
+class _RecordUnsampled(Sampler):
+    """Same decision as ``sampler``, except that dropped spans are still recorded.
+
+    Recorded spans are not exported by BatchSpanProcessor (their sampled flag
+    is off); SlowOrFailedTraceProcessor looks at them instead.
+    """
+
+    def __init__(self, sampler: Sampler):
+        self.sampler = sampler
+
+    def should_sample(self, parent_context, trace_id, name, kind=None, attributes=None, links=None, trace_state=None):
+        result = self.sampler.should_sample(parent_context, trace_id, name, kind, attributes, links, trace_state)
+        if result.decision == Decision.DROP:
+            return SamplingResult(Decision.RECORD_ONLY, attributes, result.trace_state)
+        return result
+
+    def get_description(self) -> str:
+        return f"RecordUnsampled{{{self.sampler.get_description()}}}"
+
+
+class SlowOrFailedTraceProcessor(SpanProcessor):
+    """Exports traces the sampler left out if they turn out slow or failed.
+
+    Spans of unsampled traces are buffered per trace until the local root span
+    ends; then the whole trace is either exported or dropped.
+    """
+
+    def __init__(self, exporter: SpanExporter, slow_ms: float, keep_errors: bool):
+        self.exporter = exporter
+        self.slow_ns = slow_ms * 1e6 if slow_ms > 0 else None
+        self.keep_errors = keep_errors
+        self._pending: "OrderedDict[int, List[ReadableSpan]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # One thread, so exports never run concurrently with each other
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trace-export")
+
+    def on_end(self, span: ReadableSpan):
+        if span.context.trace_flags.sampled:
+            return
+        trace_id = span.context.trace_id
+        local_root = span.parent is None or span.parent.is_remote
+        with self._lock:
+            spans = self._pending.get(trace_id)
+            if spans is None:
+                spans = self._pending[trace_id] = []
+                while len(self._pending) > _MAX_PENDING_TRACES:
+                    self._pending.popitem(last=False)
+            if len(spans) < _MAX_SPANS_PER_TRACE:
+                spans.append(span)
+            if local_root:
+                del self._pending[trace_id]
+        if local_root and self._keep(span, spans):
+            self._executor.submit(self.exporter.export, spans)
+
+    def _keep(self, root: ReadableSpan, spans: List[ReadableSpan]) -> bool:
+        if self.slow_ns is not None and root.end_time - root.start_time >= self.slow_ns:
+            return True
+        return self.keep_errors and any(s.status.status_code == StatusCode.ERROR for s in spans)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+        self.exporter.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
+
+
+def client_ip_from_headers(headers: Headers, client) -> str:
+    # Cloudflare first, then the usual proxy headers, then the peer address
+    if headers.get("cf-connecting-ip"):
+        return headers["cf-connecting-ip"]
+    if headers.get("x-forwarded-for"):
+        # X-Forwarded-For can contain multiple IPs, take the first one (original client)
+        return headers["x-forwarded-for"].split(",")[0].strip()
+    if headers.get("x-real-ip"):
+        return headers["x-real-ip"]
+    return client[0] if client else "unknown"
+
+
+def annotate_request_span(span: Span, headers: Headers, client):
+    client_ip = client_ip_from_headers(headers, client)
+    span.set_attribute("http.client_ip", client_ip)
+    span.set_attribute("net.peer.ip", client_ip)
+    if headers.get("cf-ray"):
+        span.set_attribute("cf.ray", headers["cf-ray"])
+    if headers.get("cf-ipcountry"):
+        span.set_attribute("cf.country", headers["cf-ipcountry"])
+
+    authorization = headers.get("authorization", "")
+    if authorization.startswith("Bearer "):
+        from app.auth import ALGORITHM, SECRET_KEY
+        try:
+            payload = jwt.decode(authorization[7:], SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            return
+        if payload.get("sub"):
+            span.set_attribute("user.username", payload["sub"])
+        # Tokens issued before the uid claim existed only carry the username
+        if payload.get("uid") is not None:
+            span.set_attribute("user.id", str(payload["uid"]))
+
+
+class TraceUserMiddleware:
+    """Adds client IP, Cloudflare details and the user from the bearer token to
+    the request span. Pure ASGI and no database access, so streaming bodies and
+    unsampled requests pass straight through."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http":
+            span = trace.get_current_span()
+            if span.is_recording():
+                annotate_request_span(span, Headers(scope=scope), scope.get("client"))
+        await self.app(scope, receive, send)
+
+
+def create_exporter(name: str) -> Optional[SpanExporter]:
+    if name == "jaeger":
+        from opentelemetry.exporter.jaeger.thrift import JaegerExporter
+        return JaegerExporter(
+            collector_endpoint=os.getenv("OTEL_EXPORTER_JAEGER_ENDPOINT", "http://localhost:14268/api/traces"),
+        )
+    if name == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    if name == "console":
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+        return ConsoleSpanExporter()
+    if name != "none":
+        print(f"Unknown TRACE_EXPORTER {name!r}; tracing disabled")
+    return None
+
+
+def configure_opentelemetry():
+    exporter = create_exporter(TRACE_EXPORTER)
+    if exporter is None:
+        # main.py also skips the FastAPI instrumentation in this case
+        trace.set_tracer_provider(TracerProvider(sampler=ALWAYS_OFF))
+        return
+
+    tail_sampling = TRACE_SAMPLE_RATIO < 1 and (TRACE_SLOW_MS > 0 or TRACE_KEEP_ERRORS)
+    root_sampler = TraceIdRatioBased(TRACE_SAMPLE_RATIO)
+    if tail_sampling:
+        sampler = ParentBased(
+            root=_RecordUnsampled(root_sampler),
+            local_parent_not_sampled=_RecordUnsampled(ALWAYS_OFF),
+        )
+    else:
+        sampler = ParentBased(root=root_sampler)
+
+    tracer_provider = TracerProvider(sampler=sampler)
+    tracer_provider.add_span_processor(BatchSpanProcessor(exporter))
+    if tail_sampling:
+        tracer_provider.add_span_processor(
+            SlowOrFailedTraceProcessor(create_exporter(TRACE_EXPORTER), TRACE_SLOW_MS, TRACE_KEEP_ERRORS)
+        )
+    trace.set_tracer_provider(tracer_provider)
+
+    # Instrument SQLAlchemy for PostgreSQL tracing with more details
+    from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+    SQLAlchemyInstrumentor().instrument(
+        enable_commenter=TRACE_SQL_COMMENTER,
+        enable_metric_attributes=True
+    )
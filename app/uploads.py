@@ -0,0 +1,295 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+
+from app.metrics import Transfer
+
+# Bytes buffered per part before handing a write to the thread pool
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024))
+
+# Local root for uploads in progress, and for stored files with STORAGE_BACKEND=local
+FILES_DIR = os.getenv("FILES_DIR", "files")
+
+# Uploads are written here while being hashed, then moved into the blob store
+UPLOAD_TMP_DIR = os.path.join(FILES_DIR, ".tmp")
+
+# Received parts of resumable upload sessions, one directory per session
+UPLOAD_SESSIONS_DIR = os.getenv("UPLOAD_SESSIONS_DIR", os.path.join(FILES_DIR, ".uploads"))
+
+# Schema for routes that parse their own multipart body, so /docs still shows the file picker
+MULTIPART_FILES_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["files"],
+                    "properties": {
+                        "files": {
+                            "type": "array",
+                            "items": {"type": "string", "format": "binary"},
+                        }
+                    },
+                }
+            }
+        },
+    }
+}
+
+
+@dataclass
+class IngestedFile:
+    filename: str
+    file_path: str
+    size: int
+    digest: str = ""
+    # Set by the blob store once the file at file_path has been handed to storage
+    placed: bool = False
+    new_blob: bool = False
+
+
+@dataclass
+class IngestResult:
+    files: List[IngestedFile] = field(default_factory=list)
+    bytes_received: int = 0
+    seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second written to disk for the whole request."""
+        return self.bytes_received / self.seconds if self.seconds > 0 else 0.0
+
+
+class _PartWriter:
+    """Buffers one multipart file part and writes it to disk off the event loop.
+
+    At most one write is in flight at a time, so the next chunk is parsed
+    from the network while the previous one is being hashed and written.
+    """
+
+    def __init__(self, filename: str, file_path: str, chunk_size: int):
+        self.filename = filename
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self.size = 0
+        self._buffer = bytearray()
+        self._fh = None
+        self._hash = hashlib.sha256()
+        self._pending: Optional[asyncio.Future] = None
+
+    @property
+    def digest(self) -> str:
+        return self._hash.hexdigest()
+
+    def _write_chunk(self, chunk: bytearray):
+        self._hash.update(chunk)
+        self._fh.write(chunk)
+
+    async def open(self):
+        self._fh = await run_in_threadpool(open, self.file_path, "wb")
+
+    async def write(self, data: bytes):
+        self._buffer += data
+        self.size += len(data)
+        if len(self._buffer) >= self.chunk_size:
+            await self._flush()
+
+    async def _flush(self):
+        if self._pending is not None:
+            await self._pending
+            self._pending = None
+        if self._buffer:
+            chunk, self._buffer = self._buffer, bytearray()
+            self._pending = asyncio.ensure_future(run_in_threadpool(self._write_chunk, chunk))
+
+    async def close(self):
+        await self._flush()
+        if self._pending is not None:
+            await self._pending
+            self._pending = None
+        await run_in_threadpool(self._fh.close)
+
+    async def abort(self):
+        if self._pending is not None:
+            try:
+                await self._pending
+            except Exception:
+                pass
+        if self._fh is not None:
+            await run_in_threadpool(self._fh.close)
+
+
+def session_dir(upload_id: str) -> str:
+    return os.path.join(UPLOAD_SESSIONS_DIR, upload_id)
+
+
+def part_path(upload_id: str, part_number: int) -> str:
+    return os.path.join(session_dir(upload_id), f"{part_number:05d}")
+
+
+def remove_session_dir(upload_id: str):
+    shutil.rmtree(session_dir(upload_id), ignore_errors=True)
+
+
+def temp_upload_path() -> str:
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    return os.path.join(UPLOAD_TMP_DIR, uuid.uuid4().hex)
+
+
+async def ingest_multipart(
+    request: Request,
+    field_name: str = "files",
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> IngestResult:
+    """Parse a multipart/form-data body as it arrives and stream every file
+    part of ``field_name`` into ``UPLOAD_TMP_DIR``, hashing it on the way.
+
+    Each file is written exactly once; the blob store later renames it into
+    place. Files that were written before an error (including a client
+    disconnect) are removed again.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
+
+    events = []
+    header_field = bytearray()
+    header_value = bytearray()
+    headers = []
+
+    def on_header_field(data, start, end):
+        header_field.extend(data[start:end])
+
+    def on_header_value(data, start, end):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        headers.append((bytes(header_field).lower(), bytes(header_value)))
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        events.append(("headers", list(headers)))
+        headers.clear()
+
+    def on_part_data(data, start, end):
+        events.append(("data", bytes(data[start:end])))
+
+    def on_part_end():
+        events.append(("end", None))
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    result = IngestResult()
+    current: Optional[_PartWriter] = None
+    started = time.perf_counter()
+
+    with Transfer("upload") as transfer:
+        try:
+            async for chunk in request.stream():
+                try:
+                    parser.write(chunk)
+                except MultipartParseError:
+                    raise HTTPException(status_code=400, detail="Malformed multipart body")
+                for kind, payload in events:
+                    if kind == "headers":
+                        disposition = dict(payload).get(b"content-disposition", b"")
+                        _, options = parse_options_header(disposition)
+                        name = options.get(b"name", b"").decode("utf-8", "replace")
+                        filename = options.get(b"filename")
+                        if name == field_name and filename is not None:
+                            filename = filename.decode("utf-8", "replace")
+                            current = _PartWriter(filename, temp_upload_path(), chunk_size)
+                            await current.open()
+                    elif kind == "data" and current is not None:
+                        await current.write(payload)
+                        transfer.add(len(payload))
+                    elif kind == "end" and current is not None:
+                        await current.close()
+                        result.files.append(IngestedFile(current.filename, current.file_path, current.size, current.digest))
+                        result.bytes_received += current.size
+                        current = None
+                events.clear()
+            parser.finalize()
+            if current is not None:
+                raise HTTPException(status_code=400, detail="Incomplete multipart body")
+        except BaseException:
+            if current is not None:
+                await current.abort()
+                result.files.append(IngestedFile(current.filename, current.file_path, current.size))
+            await run_in_threadpool(remove_ingested, result.files)
+            raise
+
+    result.seconds = time.perf_counter() - started
+    if not result.files:
+        raise HTTPException(status_code=400, detail="No files uploaded")
+    return result
+
+
+def remove_ingested(files: List[IngestedFile]):
+    for f in files:
+        try:
+            if os.path.exists(f.file_path):
+                os.remove(f.file_path)
+        except Exception as e:
+            print(f"Error removing partial upload {f.file_path}: {e}")
+
+
+async def stream_body_to_file(request: Request, file_path: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> int:
+    """Stream a raw request body to ``file_path`` and return its size.
+
+    The body lands in a sibling ``.partial`` file that is renamed into place
+    once complete, so a retried or concurrent request never exposes a torn file.
+    """
+    partial_path = f"{file_path}.{uuid.uuid4().hex}.partial"
+    writer = _PartWriter(os.path.basename(file_path), partial_path, chunk_size)
+    with Transfer("upload") as transfer:
+        try:
+            await writer.open()
+            async for chunk in request.stream():
+                if chunk:
+                    await writer.write(chunk)
+                    transfer.add(len(chunk))
+            await writer.close()
+            await run_in_threadpool(os.replace, partial_path, file_path)
+        except BaseException:
+            await writer.abort()
+            await run_in_threadpool(remove_ingested, [IngestedFile(writer.filename, partial_path, writer.size)])
+            raise
+    return writer.size
+
+
+def concatenate_files(part_paths: List[str], dest_path: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> Tuple[int, str]:
+    """Join ``part_paths`` in order into ``dest_path`` and return its size and
+    SHA-256 digest. Blocking; run it in a thread."""
+    size = 0
+    digest = hashlib.sha256()
+    with open(dest_path, "wb") as dest:
+        for part_path in part_paths:
+            with open(part_path, "rb") as src:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    dest.write(chunk)
+                    size += len(chunk)
+    return size, digest.hexdigest()
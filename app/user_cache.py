@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.metrics import USER_CACHE_HITS, USER_CACHE_MISSES
+from app.models import User
+
+# How long a resolved user is trusted without asking the database. This bounds how
+# stale another worker's copy can be after a password change or admin edit.
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", 30))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+
+_USER_COLUMNS = [attr.key for attr in inspect(User).column_attrs]
+
+
+class UserCache:
+    """Bounded LRU of User column values keyed by username, with a TTL.
+
+    Stores plain dicts, never ORM instances, so nothing is shared between
+    sessions. ``generation`` moves on every invalidation; a lookup that
+    started before one must not repopulate the cache with what it read.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # Admin actions and the event loop can touch the cache from different threads
+        self._lock = threading.Lock()
+
+    def get(self, username: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return None
+            expires, values = entry
+            if expires < time.monotonic():
+                del self._entries[username]
+                return None
+            self._entries.move_to_end(username)
+            return values
+
+    def put(self, username: str, values: dict, generation: int):
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[username] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *usernames: str):
+        """Forget the given users, or everyone if none are given."""
+        with self._lock:
+            self.generation += 1
+            if not usernames:
+                self._entries.clear()
+            for username in usernames:
+                self._entries.pop(username, None)
+
+
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+
+
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
+    """Resolve ``username`` to a User attached to ``db``, from the cache when possible.
+
+    Cached users are merged in without a SELECT, so callers can still modify
+    and commit them as if they had been queried.
+    """
+    values = user_cache.get(username)
+    if values is not None:
+        USER_CACHE_HITS.inc()
+        user = User(**values)
+        make_transient_to_detached(user)
+        return await db.merge(user, load=False)
+
+    USER_CACHE_MISSES.inc()
+    generation = user_cache.generation
+    result = await db.execute(select(User).where(User.username == username))
+    user = result.scalars().first()
+    if user is not None:
+        user_cache.put(username, {key: getattr(user, key) for key in _USER_COLUMNS}, generation)
+    return user
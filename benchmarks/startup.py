@@ -0,0 +1,156 @@
+"""Cold-start cost of the app: import time, and time until every worker serves.
+
+    DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.startup [--workers N] [--budget-ms MS]
+
+Import time is the median of several fresh interpreters running
+``import app.main``, with tracing enabled (as deployed) and disabled, followed
+by the slowest top-level imports. The run fails (exit status 1) if the
+deployed configuration exceeds --budget-ms, so it can guard against new
+import-time dependencies.
+
+Time to ready launches N workers with ``uvicorn --workers`` (each worker
+imports the app itself) and with ``python -m app.serve`` (imported once, then
+forked), and measures until every worker has completed its startup. On Linux
+it also reports the workers' combined proportional memory (PSS).
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+
+def _env(**overrides) -> dict:
+    env = dict(os.environ)
+    env.setdefault("TRACE_EXPORTER", "jaeger")
+    env.update(overrides)
+    return env
+
+
+def import_seconds(runs: int, **overrides) -> float:
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET],
+            cwd=REPO_ROOT, env=_env(**overrides), check=True, capture_output=True, text=True,
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+
+def slowest_imports(count: int) -> list:
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=REPO_ROOT, env=_env(), check=True, capture_output=True, text=True,
+    ).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Direct imports of app.main and app.* modules, i.e. what this repo decides to load
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1 or name.strip().startswith("app."):
+            modules.append((int(cumulative) / 1000, name.strip()))
+    return sorted(modules, reverse=True)[:count]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _pss_mb(pid: int) -> float:
+    total = 0
+    for child in [pid] + _children(pid):
+        try:
+            with open(f"/proc/{child}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Pss:"):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total / 1024
+
+
+def _children(pid: int) -> list:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+    return children + [grandchild for child in children for grandchild in _children(child)]
+
+
+def time_to_ready(mode: str, workers: int, timeout: float = 120) -> dict:
+    port = _free_port()
+    if mode == "uvicorn --workers":
+        args = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", str(workers)]
+    else:
+        args = [sys.executable, "-m", "app.serve"]
+    env = _env(PORT=str(port), WEB_CONCURRENCY=str(workers), RUN_MIGRATIONS="false", PYTHONUNBUFFERED="1")
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        args, cwd=REPO_ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+    ready = 0
+    try:
+        for line in process.stdout:
+            if "Application startup complete" in line:
+                ready += 1
+                if ready == workers:
+                    break
+            if time.perf_counter() - started > timeout:
+                break
+        elapsed = time.perf_counter() - started
+        if ready < workers:
+            raise RuntimeError(f"{mode}: only {ready} of {workers} workers started")
+        # Let the workers settle (job runner, notification listener) before measuring memory
+        time.sleep(1)
+        memory = _pss_mb(process.pid) if sys.platform.startswith("linux") else None
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return {"seconds": elapsed, "pss_mb": memory}
+
+
+def main(workers: int, runs: int, budget_ms: float):
+    deployed = import_seconds(runs) * 1000
+    untraced = import_seconds(runs, TRACE_EXPORTER="none") * 1000
+    print(f"import app.main (median of {runs})")
+    print(f"  {'tracing enabled':<28}{deployed:>8.0f} ms   budget {budget_ms:.0f} ms")
+    print(f"  {'TRACE_EXPORTER=none':<28}{untraced:>8.0f} ms")
+    print("\nslowest imports (cumulative)")
+    for ms, name in slowest_imports(12):
+        print(f"  {name:<44}{ms:>8.0f} ms")
+
+    print(f"\ntime until {workers} workers are ready")
+    for mode in ("uvicorn --workers", "python -m app.serve"):
+        result = time_to_ready(mode, workers)
+        memory = f"{result['pss_mb']:>8.0f} MB PSS" if result["pss_mb"] is not None else ""
+        print(f"  {mode:<28}{result['seconds']:>8.2f} s{memory}")
+
+    if deployed > budget_ms:
+        print(f"\nImport time {deployed:.0f} ms exceeds the {budget_ms:.0f} ms budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per import measurement")
+    parser.add_argument("--budget-ms", type=float, default=1500, help="import time allowed with tracing enabled")
+    args = parser.parse_args()
+    main(args.workers, args.runs, args.budget_ms)
@@ -0,0 +1,491 @@
+"""Hot-path benchmarks for the API, driven in-process through httpx's ASGI transport.
+
+    DATABASE_URL=postgresql+asyncpg://.../scratch python -m benchmarks.suite [--scale 0.1] [--only upload_small,...]
+    python -m benchmarks.suite compare benchmarks/results/A.json benchmarks/results/B.json
+
+DATABASE_URL must point at a migrated scratch database (``alembic upgrade
+head``). Everything the suite creates belongs to users named
+``bench-<run id>-*`` and is deleted again at the end. Stored files go to a
+temporary FILES_DIR; tracing is off unless TRACE_EXPORTER is set, and so are
+the rate limits unless RATE_LIMIT_ENABLED is.
+
+Each run writes one JSON file (default ``benchmarks/results/<time>-<commit>.json``)
+with the environment and, per scenario, its parameters and measurements.
+``compare`` prints the relative change of every measurement between two runs.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import secrets
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+SCENARIOS = ["upload_small", "upload_huge", "download", "share_listing", "unlock_burst", "cleanup_backlog"]
+
+
+def latency_summary(samples) -> dict:
+    samples = sorted(samples)
+    return {
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": samples[len(samples) // 2] * 1000,
+        "p95_ms": samples[min(int(len(samples) * 0.95), len(samples) - 1)] * 1000,
+        "p99_ms": samples[min(int(len(samples) * 0.99), len(samples) - 1)] * 1000,
+    }
+
+
+def scaled(value: int, scale: float, minimum: int = 1) -> int:
+    return max(int(value * scale), minimum)
+
+
+class Bench:
+    """Shared state for one run: the HTTP client, the run id and the users it created."""
+
+    def __init__(self, client, run_id: str, scale: float):
+        self.client = client
+        self.run_id = run_id
+        self.scale = scale
+        self.usernames = []
+
+    async def create_user(self, suffix: str):
+        from app.auth import get_password_hash
+        from app.db import AsyncSessionLocal
+        from app.models import User
+
+        username = f"bench-{self.run_id}-{suffix}"
+        password = secrets.token_hex(8)
+        async with AsyncSessionLocal() as db:
+            user = User(username=username, hashed_password=await get_password_hash(password), must_change_password=False)
+            db.add(user)
+            await db.commit()
+            await db.refresh(user)
+        self.usernames.append(username)
+        response = await self.client.post("/token", data={"username": username, "password": password})
+        response.raise_for_status()
+        return user, {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def upload(self, headers: dict, files) -> dict:
+        response = await self.client.post("/upload", files=files, headers=headers)
+        response.raise_for_status()
+        return response.json()
+
+    async def public_tokens(self, public_id: str) -> list:
+        response = await self.client.get(f"/public/share/{public_id}")
+        response.raise_for_status()
+        return [f["token"] for f in response.json()["files"]]
+
+    async def cleanup(self):
+        """Delete every share, file, blob reference and user this run created."""
+        from sqlalchemy import delete, select
+        from app.blobs import delete_released, release_files
+        from app.db import AsyncSessionLocal
+        from app.models import FileRecord, Share, UploadSession, User
+
+        async with AsyncSessionLocal() as db:
+            user_ids = select(User.id).where(User.username.in_(self.usernames)).scalar_subquery()
+            share_ids = select(Share.id).where(Share.owner_id.in_(user_ids)).scalar_subquery()
+            result = await db.execute(
+                delete(FileRecord).where(FileRecord.share_id.in_(share_ids))
+                .returning(FileRecord.file_path, FileRecord.blob_digest)
+                .execution_options(synchronize_session=False)
+            )
+            released = await release_files(db, result.all())
+            await db.execute(delete(Share).where(Share.owner_id.in_(user_ids)).execution_options(synchronize_session=False))
+            await db.execute(delete(UploadSession).where(UploadSession.owner_id.in_(user_ids)).execution_options(synchronize_session=False))
+            await db.execute(delete(User).where(User.username.in_(self.usernames)).execution_options(synchronize_session=False))
+            await db.commit()
+        await delete_released(released)
+
+
+async def upload_small(bench: Bench) -> dict:
+    """Many small files per request; dominated by per-file and per-row overhead."""
+    requests = scaled(20, bench.scale)
+    files_per_request = scaled(200, bench.scale, 10)
+    file_size = 4096
+    _, headers = await bench.create_user("upload-small")
+
+    latencies = []
+    for _ in range(requests):
+        # Fresh random content every time, so blob deduplication never short-circuits the write
+        files = [("files", (f"f{i}.bin", os.urandom(file_size))) for i in range(files_per_request)]
+        started = time.perf_counter()
+        await bench.upload(headers, files)
+        latencies.append(time.perf_counter() - started)
+
+    elapsed = sum(latencies)
+    return {
+        "params": {"requests": requests, "files_per_request": files_per_request, "file_size": file_size},
+        "files_per_s": requests * files_per_request / elapsed,
+        "requests_per_s": requests / elapsed,
+        **latency_summary(latencies),
+    }
+
+
+def _write_random_file(path: str, size: int):
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            chunk = os.urandom(min(remaining, 4 * 1024 * 1024))
+            f.write(chunk)
+            remaining -= len(chunk)
+
+
+async def upload_huge(bench: Bench) -> dict:
+    """A few very large files in one request; streaming, hashing and disk throughput."""
+    file_count = 2
+    file_size = scaled(256 * 1024 * 1024, bench.scale, 1024 * 1024)
+    requests = 2
+    _, headers = await bench.create_user("upload-huge")
+
+    latencies = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for _ in range(requests):
+            paths = [os.path.join(tmp, f"huge{i}.bin") for i in range(file_count)]
+            for path in paths:
+                _write_random_file(path, file_size)
+            handles = [open(path, "rb") for path in paths]
+            try:
+                started = time.perf_counter()
+                await bench.upload(headers, [("files", (os.path.basename(h.name), h)) for h in handles])
+                latencies.append(time.perf_counter() - started)
+            finally:
+                for handle in handles:
+                    handle.close()
+
+    total_bytes = requests * file_count * file_size
+    return {
+        "params": {"requests": requests, "files_per_request": file_count, "file_size": file_size},
+        "mb_per_s": total_bytes / sum(latencies) / 1e6,
+        **latency_summary(latencies),
+    }
+
+
+async def download(bench: Bench) -> dict:
+    """GET /public/file/{token}: one large file for throughput, many small ones for request rate."""
+    large_size = scaled(64 * 1024 * 1024, bench.scale, 1024 * 1024)
+    large_repeats = 5
+    small_requests = scaled(2000, bench.scale, 50)
+    concurrency = 16
+    _, headers = await bench.create_user("download")
+
+    share = await bench.upload(headers, [
+        ("files", ("large.bin", os.urandom(large_size))),
+        ("files", ("small.txt", os.urandom(2048))),
+    ])
+    large_token, small_token = await bench.public_tokens(share["public_id"])
+
+    large_latencies = []
+    for _ in range(large_repeats):
+        started = time.perf_counter()
+        response = await bench.client.get(f"/public/file/{large_token}")
+        large_latencies.append(time.perf_counter() - started)
+        assert len(response.content) == large_size
+
+    semaphore = asyncio.Semaphore(concurrency)
+    small_latencies = []
+
+    async def fetch_small():
+        async with semaphore:
+            started = time.perf_counter()
+            response = await bench.client.get(f"/public/file/{small_token}")
+            small_latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(fetch_small() for _ in range(small_requests)))
+    small_elapsed = time.perf_counter() - started
+
+    return {
+        "params": {
+            "large_size": large_size, "large_repeats": large_repeats,
+            "small_requests": small_requests, "concurrency": concurrency,
+        },
+        "large_mb_per_s": large_size * large_repeats / sum(large_latencies) / 1e6,
+        "small_requests_per_s": small_requests / small_elapsed,
+        "small": latency_summary(small_latencies),
+    }
+
+
+async def share_listing(bench: Bench) -> dict:
+    """GET /shares for a user with a long history: first page and a walk through every page."""
+    from sqlalchemy import insert
+    from app.db import AsyncSessionLocal
+    from app.models import FileRecord, Share
+
+    share_count = scaled(20000, bench.scale, 200)
+    files_per_share = 3
+    user, headers = await bench.create_user("listing")
+
+    now = datetime.utcnow()
+    async with AsyncSessionLocal() as db:
+        for offset in range(0, share_count, 1000):
+            batch = range(offset, min(offset + 1000, share_count))
+            result = await db.execute(
+                insert(Share).returning(Share.id),
+                [{
+                    "public_id": f"bench-{bench.run_id}-{i}",
+                    "owner_id": user.id,
+                    "created_at": now - timedelta(seconds=i),
+                    "expires_at": now + timedelta(days=1),
+                } for i in batch],
+            )
+            share_ids = result.scalars().all()
+            await db.execute(insert(FileRecord), [
+                {"filename": f"file{n}.txt", "share_id": share_id}
+                for share_id in share_ids for n in range(files_per_share)
+            ])
+        await db.commit()
+
+    first_page = []
+    for _ in range(20):
+        started = time.perf_counter()
+        response = await bench.client.get("/shares", headers=headers)
+        first_page.append(time.perf_counter() - started)
+        response.raise_for_status()
+
+    pages = 0
+    cursor = None
+    started = time.perf_counter()
+    while True:
+        params = {"cursor": cursor} if cursor else {}
+        response = await bench.client.get("/shares", params=params, headers=headers)
+        response.raise_for_status()
+        pages += 1
+        cursor = response.json()["next_cursor"]
+        if not cursor:
+            break
+    walk = time.perf_counter() - started
+
+    return {
+        "params": {"shares": share_count, "files_per_share": files_per_share},
+        "first_page": latency_summary(first_page),
+        "full_walk_s": walk,
+        "pages": pages,
+        "ms_per_page": walk / pages * 1000,
+    }
+
+
+async def unlock_burst(bench: Bench) -> dict:
+    """Concurrent unlocks of a password-protected share (bcrypt in the password pool)."""
+    burst = scaled(64, bench.scale, 8)
+    _, headers = await bench.create_user("unlock")
+    share = await bench.upload(headers, [("files", ("a.txt", b"unlock"))])
+    public_id = share["public_id"]
+    response = await bench.client.post(f"/share/{public_id}", json={"password": "bench-secret"}, headers=headers)
+    response.raise_for_status()
+
+    statuses = []
+    latencies = []
+
+    async def unlock():
+        started = time.perf_counter()
+        # Fresh cookie jar per attempt, so no access grant short-circuits the password check
+        response = await bench.client.post(
+            f"/public/share/{public_id}/unlock", json={"password": "bench-secret"}, cookies={}
+        )
+        latencies.append(time.perf_counter() - started)
+        statuses.append(response.status_code)
+
+    bench.client.cookies.clear()
+    started = time.perf_counter()
+    await asyncio.gather(*(unlock() for _ in range(burst)))
+    elapsed = time.perf_counter() - started
+    bench.client.cookies.clear()
+
+    succeeded = statuses.count(200)
+    return {
+        "params": {"burst": burst},
+        "succeeded": succeeded,
+        "rejected_503": statuses.count(503),
+        "unlocks_per_s": succeeded / elapsed,
+        "burst_s": elapsed,
+        **latency_summary(latencies),
+    }
+
+
+async def cleanup_backlog(bench: Bench) -> dict:
+    """run_expiry over a large backlog of expired shares, each with one blob on disk."""
+    from sqlalchemy import insert
+    from app.db import AsyncSessionLocal
+    from app.models import Blob, FileRecord, Share
+    from app.storage import storage
+    from app.tasks import run_expiry
+
+    share_count = scaled(20000, bench.scale, 200)
+    user, _ = await bench.create_user("cleanup")
+
+    now = datetime.utcnow()
+    async with AsyncSessionLocal() as db:
+        for offset in range(0, share_count, 1000):
+            batch = range(offset, min(offset + 1000, share_count))
+            digests = []
+            for i in batch:
+                content = f"{bench.run_id}-{i}".encode()
+                digest = hashlib.sha256(content).hexdigest()
+                path = storage.path(digest)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(content)
+                digests.append((digest, len(content)))
+            await db.execute(insert(Blob), [{"digest": d, "size": size, "refcount": 1} for d, size in digests])
+            result = await db.execute(
+                insert(Share).returning(Share.id),
+                [{
+                    "public_id": f"bench-{bench.run_id}-expired-{i}",
+                    "owner_id": user.id,
+                    "created_at": now - timedelta(hours=2),
+                    "expires_at": now - timedelta(hours=1),
+                } for i in batch],
+            )
+            await db.execute(insert(FileRecord), [
+                {"filename": "expired.bin", "share_id": share_id, "blob_digest": digest}
+                for share_id, (digest, _) in zip(result.scalars().all(), digests)
+            ])
+        await db.commit()
+
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        await run_expiry(db, datetime.utcnow())
+    elapsed = time.perf_counter() - started
+
+    return {
+        "params": {"shares": share_count},
+        "duration_s": elapsed,
+        "shares_per_s": share_count / elapsed,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run_suite(scenarios, scale: float) -> dict:
+    import httpx
+    from app.auth import shutdown_password_pool
+    from app.db import engine
+    from app.logging_utils import stop_log_writer
+    from app.main import app
+
+    # SQL echo would dominate every timing
+    engine.echo = False
+    run_id = secrets.token_hex(4)
+    results = {}
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None
+    ) as client:
+        bench = Bench(client, run_id, scale)
+        try:
+            for name in scenarios:
+                print(f"{name} ...", flush=True)
+                started = time.perf_counter()
+                results[name] = await globals()[name](bench)
+                print(f"{name}: {time.perf_counter() - started:.1f}s {json.dumps(results[name])}", flush=True)
+        finally:
+            await bench.cleanup()
+            shutdown_password_pool()
+            stop_log_writer()
+            await engine.dispose()
+    return results
+
+
+def compare(path_a: str, path_b: str):
+    with open(path_a) as f:
+        a = json.load(f)
+    with open(path_b) as f:
+        b = json.load(f)
+
+    def flatten(prefix, value, out):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if key != "params":
+                    flatten(f"{prefix}.{key}" if prefix else key, item, out)
+        elif isinstance(value, (int, float)):
+            out[prefix] = value
+        return out
+
+    before = flatten("", a["results"], {})
+    after = flatten("", b["results"], {})
+    print(f"{'measurement':<44}{'A':>14}{'B':>14}{'change':>10}")
+    for key in sorted(before.keys() & after.keys()):
+        change = f"{(after[key] / before[key] - 1) * 100:+.1f}%" if before[key] else "n/a"
+        print(f"{key:<44}{before[key]:>14.2f}{after[key]:>14.2f}{change:>10}")
+    for scenario in a["results"]:
+        if scenario in b["results"] and a["results"][scenario].get("params") != b["results"][scenario].get("params"):
+            print(f"note: {scenario} ran with different parameters in A and B")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command")
+    compare_parser = sub.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("a")
+    compare_parser.add_argument("b")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply data sizes and counts (e.g. 0.1 for a quick run)")
+    parser.add_argument("--only", help="comma-separated scenarios: " + ", ".join(SCENARIOS))
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<time>-<commit>.json)")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        compare(args.a, args.b)
+        return
+
+    scenarios = args.only.split(",") if args.only else SCENARIOS
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    # Stored files and event logs go to a throwaway directory; set before the app is imported
+    workdir = tempfile.mkdtemp(prefix="cloudvault-bench-")
+    os.environ["FILES_DIR"] = os.path.join(workdir, "files")
+    os.environ["STORAGE_BACKEND"] = "local"
+    os.environ.setdefault("TRACE_EXPORTER", "none")
+    # Every request comes from the same client address, which the per-IP limits would soon refuse
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(workdir)
+
+    started = datetime.utcnow()
+    try:
+        results = asyncio.run(run_suite(scenarios, args.scale))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    commit = git_commit()
+    report = {
+        "started_at": started.isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "scale": args.scale,
+        "settings": {
+            key: os.environ[key] for key in sorted(os.environ)
+            if key.startswith(("STORAGE_", "PASSWORD_HASH_", "UPLOAD_", "DOWNLOAD_", "EXPIRY_", "TRACE_", "LOG_",
+                                "RATE_LIMIT_", "DB_"))
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{started.strftime('%Y%m%d-%H%M%S')}-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Requests/s with the old add_user_to_traces middleware and with TraceUserMiddleware.
+
+    DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.trace_middleware [--requests N] [--concurrency C]
+
+Both run inside a recording request span (every request sampled, nothing
+exported), on an authenticated JSON route and on a 1 MiB streaming route.
+The old middleware is reproduced here as it was: BaseHTTPMiddleware, a
+second JWT decode and a user lookup in a fresh session per request.
+"""
+import argparse
+import asyncio
+import time
+from datetime import timedelta
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from opentelemetry import trace
+from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from opentelemetry.sdk.trace import TracerProvider
+
+from app.auth import create_access_token
+from app.db import engine
+from app.tracing import TraceUserMiddleware
+
+STREAM_CHUNKS = 16
+STREAM_CHUNK = b"x" * 65536
+
+
+async def add_user_to_traces(request: Request, call_next):
+    current_span = trace.get_current_span()
+    if current_span:
+        client_ip = request.headers.get("cf-connecting-ip")
+        if not client_ip:
+            x_forwarded_for = request.headers.get("x-forwarded-for")
+            if x_forwarded_for:
+                client_ip = x_forwarded_for.split(",")[0].strip()
+            else:
+                client_ip = request.headers.get("x-real-ip") or (request.client.host if request.client else "unknown")
+        current_span.set_attribute("http.client_ip", client_ip)
+        current_span.set_attribute("net.peer.ip", client_ip)
+
+        username = None
+        user_id = None
+        auth_header = request.headers.get("authorization")
+        if auth_header and auth_header.startswith("Bearer "):
+            try:
+                from jose import jwt
+                from app.auth import SECRET_KEY, ALGORITHM
+                payload = jwt.decode(auth_header.split(" ")[1], SECRET_KEY, algorithms=[ALGORITHM])
+                username = payload.get("sub")
+                if username:
+                    try:
+                        from app.db import get_db
+                        from app.models import User
+                        from sqlalchemy import select
+                        async for db in get_db():
+                            result = await db.execute(select(User).where(User.username == username))
+                            user = result.scalars().first()
+                            if user:
+                                user_id = str(user.id)
+                            break
+                    except Exception:
+                        pass
+            except Exception:
+                pass
+        if username:
+            current_span.set_attribute("user.username", username)
+            if user_id:
+                current_span.set_attribute("user.id", user_id)
+
+    return await call_next(request)
+
+
+def build_app(variant: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/stream")
+    async def stream():
+        async def body():
+            for _ in range(STREAM_CHUNKS):
+                yield STREAM_CHUNK
+        return StreamingResponse(body())
+
+    if variant == "before":
+        app.middleware("http")(add_user_to_traces)
+    elif variant == "after":
+        app.add_middleware(TraceUserMiddleware)
+    FastAPIInstrumentor.instrument_app(app)
+    return app
+
+
+async def run(app: FastAPI, path: str, requests: int, concurrency: int, headers: dict) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def one():
+            async with semaphore:
+                response = await client.get(path, headers=headers)
+                response.raise_for_status()
+
+        await asyncio.gather(*(one() for _ in range(min(200, requests))))
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        return requests / (time.perf_counter() - started)
+
+
+async def main(requests: int, concurrency: int):
+    trace.set_tracer_provider(TracerProvider())
+    engine.echo = False
+    token = create_access_token({"sub": "bench", "uid": 1}, timedelta(minutes=10))
+    headers = {"Authorization": f"Bearer {token}", "X-Forwarded-For": "203.0.113.7"}
+
+    print(f"{requests} requests per case, {concurrency} concurrent\n")
+    print(f"{'route':<10}{'no middleware':>16}{'before':>12}{'after':>12}")
+    for path in ("/small", "/stream"):
+        results = {}
+        for variant in ("none", "before", "after"):
+            results[variant] = await run(build_app(variant), path, requests, concurrency, headers)
+        print(f"{path:<10}{results['none']:>14.0f}/s{results['before']:>10.0f}/s{results['after']:>10.0f}/s")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
@@ -0,0 +1,143 @@
+"""Per-request cost of each tracing configuration.
+
+    DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.tracing_overhead [--requests N]
+
+Every mode runs in a fresh interpreter (a tracer provider can only be set
+once) against a small FastAPI app whose route runs one SQL query through
+app.db.engine, so both the FastAPI and the SQLAlchemy instrumentation are
+exercised. Jaeger and OTLP export to a local stub collector that accepts
+and discards everything, so serialisation and HTTP cost are included but
+no collector is needed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MODES = [
+    ("no instrumentation", None),
+    ("none", {"TRACE_EXPORTER": "none"}),
+    ("jaeger 100% + commenter", {"TRACE_EXPORTER": "jaeger", "TRACE_SAMPLE_RATIO": "1", "TRACE_SQL_COMMENTER": "true"}),
+    ("jaeger 100%", {"TRACE_EXPORTER": "jaeger", "TRACE_SAMPLE_RATIO": "1", "TRACE_SQL_COMMENTER": "false"}),
+    ("otlp 100%", {"TRACE_EXPORTER": "otlp", "TRACE_SAMPLE_RATIO": "1", "TRACE_SQL_COMMENTER": "false"}),
+    ("otlp 10%", {
+        "TRACE_EXPORTER": "otlp", "TRACE_SAMPLE_RATIO": "0.1", "TRACE_SQL_COMMENTER": "false",
+        "TRACE_SLOW_MS": "0", "TRACE_KEEP_ERRORS": "false",
+    }),
+    ("otlp 10% + slow/errors", {
+        "TRACE_EXPORTER": "otlp", "TRACE_SAMPLE_RATIO": "0.1", "TRACE_SQL_COMMENTER": "false",
+        "TRACE_SLOW_MS": "1000", "TRACE_KEEP_ERRORS": "true",
+    }),
+    ("otlp 1%", {
+        "TRACE_EXPORTER": "otlp", "TRACE_SAMPLE_RATIO": "0.01", "TRACE_SQL_COMMENTER": "false",
+        "TRACE_SLOW_MS": "0", "TRACE_KEEP_ERRORS": "false",
+    }),
+    ("console 100%", {"TRACE_EXPORTER": "console", "TRACE_SAMPLE_RATIO": "1", "TRACE_SQL_COMMENTER": "false"}),
+]
+
+
+class _StubCollector(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("content-length", 0)))
+        self.send_response(200)
+        self.send_header("content-length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+async def _measure(requests: int, instrument: bool) -> dict:
+    import httpx
+    from fastapi import FastAPI
+    from sqlalchemy import text
+
+    if instrument:
+        from app.tracing import configure_opentelemetry
+        configure_opentelemetry()
+    from app.db import engine
+    engine.echo = False
+
+    app = FastAPI()
+
+    @app.get("/bench")
+    async def bench():
+        async with engine.connect() as conn:
+            return {"value": (await conn.execute(text("SELECT 1"))).scalar()}
+
+    if instrument:
+        # Mirrors app/main.py
+        from app.tracing import TRACING_ENABLED
+        from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+        if TRACING_ENABLED:
+            FastAPIInstrumentor.instrument_app(app)
+
+    timings = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for _ in range(min(200, requests)):
+            await client.get("/bench")
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = await client.get("/bench")
+            timings.append(time.perf_counter() - started)
+            response.raise_for_status()
+    await engine.dispose()
+
+    timings.sort()
+    return {
+        "mean_us": statistics.fmean(timings) * 1e6,
+        "p50_us": timings[len(timings) // 2] * 1e6,
+        "p99_us": timings[int(len(timings) * 0.99)] * 1e6,
+    }
+
+
+def _run_child(requests: int, instrument: bool):
+    # Keep the console exporter (and anything else) from mixing with the result line
+    result_fd = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    result = asyncio.run(_measure(requests, instrument))
+    os.write(result_fd, (json.dumps(result) + "\n").encode())
+
+
+def main(requests: int):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubCollector)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_port}"
+
+    print(f"{requests} sequential requests per mode, one SELECT each\n")
+    print(f"{'mode':<28}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}{'overhead':>10}")
+    baseline = None
+    for name, settings in MODES:
+        env = dict(os.environ)
+        env.update(settings or {})
+        env["OTEL_EXPORTER_JAEGER_ENDPOINT"] = f"{endpoint}/api/traces"
+        env["OTEL_EXPORTER_OTLP_ENDPOINT"] = endpoint
+        args = [sys.executable, "-m", "benchmarks.tracing_overhead", "--child", "--requests", str(requests)]
+        if settings is None:
+            args.append("--no-instrumentation")
+        output = subprocess.run(args, env=env, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if baseline is None:
+            baseline = result["mean_us"]
+        overhead = f"{(result['mean_us'] / baseline - 1) * 100:+.0f}%"
+        print(f"{name:<28}{result['mean_us']:>10.0f}{result['p50_us']:>10.0f}{result['p99_us']:>10.0f}{overhead:>10}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--no-instrumentation", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _run_child(args.requests, not args.no_instrumentation)
+    else:
+        main(args.requests)
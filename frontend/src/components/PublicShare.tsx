@@ -11,6 +11,14 @@ interface FileData {
 interface ShareData {
   locked: boolean
   files: FileData[]
+  file_count?: number
+  next_cursor?: string | null
+  archive_token?: string | null
+}
+
+interface FilePage {
+  files: FileData[]
+  next_cursor: string | null
 }
 
 export default function PublicShare() {
@@ -19,6 +27,10 @@ export default function PublicShare() {
   const [error, setError] = useState('')
   const [locked, setLocked] = useState(false)
   const [files, setFiles] = useState<FileData[]>([])
+  const [archiveToken, setArchiveToken] = useState<string | null>(null)
+  const [fileCount, setFileCount] = useState(0)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [password, setPassword] = useState('')
   const [showPassword, setShowPassword] = useState(false)
 
@@ -34,9 +46,10 @@ export default function PublicShare() {
       if (data.locked) {
         setLocked(true)
         setFiles([])
+        setArchiveToken(null)
+        setNextCursor(null)
       } else {
-        setLocked(false)
-        setFiles(data.files)
+        showShare(data)
       }
     } catch (e) {
       setError(e instanceof Error ? e.message : 'Failed to load share')
@@ -45,6 +58,30 @@ export default function PublicShare() {
     }
   }
 
+  function showShare(data: ShareData) {
+    setLocked(false)
+    setFiles(data.files)
+    setFileCount(data.file_count ?? data.files.length)
+    setNextCursor(data.next_cursor ?? null)
+    setArchiveToken(data.archive_token ?? null)
+  }
+
+  // The share response only carries the first page of files (and download tokens)
+  async function loadMoreFiles() {
+    if (!id || !nextCursor) return
+
+    try {
+      setLoadingMore(true)
+      const page: FilePage = await apiRequest(`/public/share/${id}/files?cursor=${encodeURIComponent(nextCursor)}`, 'GET')
+      setFiles(prev => [...prev, ...page.files])
+      setNextCursor(page.next_cursor)
+    } catch (e) {
+      setError(e instanceof Error ? e.message : 'Failed to load files')
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   async function unlock(e: React.FormEvent) {
     e.preventDefault()
     if (!id) return
@@ -53,8 +90,7 @@ export default function PublicShare() {
       setLoading(true)
       setError('')
       const data: ShareData = await apiRequest(`/public/share/${id}/unlock`, 'POST', { password })
-      setLocked(false)
-      setFiles(data.files)     
+      showShare(data)
       setPassword('')
     } catch (e) {
       setError(e instanceof Error ? e.message : 'Failed to unlock share')
@@ -108,10 +144,14 @@ export default function PublicShare() {
               ) : (
                 <button 
                   onClick={() => {
-                    files.forEach(file => {
+                    // One streamed ZIP instead of a request per file
+                    const targets = fileCount > 1 && archiveToken
+                      ? [{ href: `/api/public/zip/${archiveToken}`, filename: '' }]
+                      : files.map(file => ({ href: `/api/public/file/${file.token}`, filename: file.filename }));
+                    targets.forEach(target => {
                       const link = document.createElement('a');
-                      link.href = `/api/public/file/${file.token}`;
-                      link.download = file.filename;
+                      link.href = target.href;
+                      link.download = target.filename;
                       document.body.appendChild(link);
                       link.click();
                       document.body.removeChild(link);
@@ -203,6 +243,15 @@ export default function PublicShare() {
                         </div>
                       </div>
                     ))}
+                    {nextCursor && (
+                      <button
+                        onClick={loadMoreFiles}
+                        disabled={loadingMore}
+                        className="p-3 bg-white/10 rounded-xl border border-white/20 text-white/80 hover:bg-white/15 transition-all duration-200"
+                      >
+                        {loadingMore ? 'Loading...' : `Show more (${files.length} of ${fileCount})`}
+                      </button>
+                    )}
                   </div>
                 ) : (
                   <p className="text-white/60 italic">No files available in this share.</p>
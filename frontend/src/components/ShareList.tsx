@@ -26,12 +26,15 @@ export default function ShareList({ token, onShareSelect, onTokenExpired }: Shar
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState('')
   const [deletingId, setDeletingId] = useState<string | null>(null)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const [loadingMore, setLoadingMore] = useState(false)
 
   const fetchShares = async () => {
     try {
       setLoading(true)
-      const userShares = await getUserShares(token)
-      setShares(userShares)
+      const page = await getUserShares(token)
+      setShares(page.items)
+      setNextCursor(page.next_cursor)
       setError('')
     } catch (e) {
       const error = e as ApiError
@@ -45,6 +48,26 @@ export default function ShareList({ token, onShareSelect, onTokenExpired }: Shar
     }
   }
 
+  const loadMoreShares = async () => {
+    if (!nextCursor) return
+    try {
+      setLoadingMore(true)
+      const page = await getUserShares(token, nextCursor)
+      setShares(prev => [...prev, ...page.items])
+      setNextCursor(page.next_cursor)
+      setError('')
+    } catch (e) {
+      const error = e as ApiError
+      if (error.isTokenExpired) {
+        onTokenExpired()
+      } else {
+        setError(error instanceof Error ? error.message : 'Failed to load shares')
+      }
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   const handleDeleteShare = async (publicId: string) => {
     if (!confirm('Are you sure you want to delete this share and all its files?')) {
       return
@@ -93,7 +116,7 @@ export default function ShareList({ token, onShareSelect, onTokenExpired }: Shar
       <div className="flex justify-between items-center">
         <h3 className="text-xl font-semibold text-white flex items-center gap-2">
           <Folder className="w-5 h-5" />
-          Your Shares ({shares.length})
+          Your Shares ({shares.length}{nextCursor ? '+' : ''})
         </h3>
         <Button
           onClick={fetchShares}
@@ -213,6 +236,16 @@ export default function ShareList({ token, onShareSelect, onTokenExpired }: Shar
               </div>
             </div>
           ))}
+          {nextCursor && (
+            <Button
+              onClick={loadMoreShares}
+              disabled={loadingMore}
+              variant="outline"
+              className="bg-white/10 border-white/20 text-white hover:bg-white/20"
+            >
+              {loadingMore ? 'Loading...' : 'Load more'}
+            </Button>
+          )}
         </div>
       )}
     </div>
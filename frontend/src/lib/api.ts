@@ -109,8 +109,14 @@ export async function uploadFiles(files: FileList, token: string): Promise<any>
 }
 
 // Share management functions
-export async function getUserShares(token: string): Promise<any[]> {
-  return apiRequest('/shares', 'GET', null, token);
+export interface SharePage {
+  items: any[];
+  next_cursor: string | null;
+}
+
+export async function getUserShares(token: string, cursor?: string | null): Promise<SharePage> {
+  const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+  return apiRequest(`/shares${query}`, 'GET', null, token);
 }
 
 export async function getShareDetails(publicId: string, token: string): Promise<any> {
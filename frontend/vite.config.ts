@@ -23,6 +23,8 @@ export default defineConfig({
       '/api': {
         target: 'http://web:8000',
         changeOrigin: true,
+        // Adds X-Forwarded-For, so the backend sees client IPs (see FORWARDED_ALLOW_IPS)
+        xfwd: true,
         rewrite: (path) => path.replace(/^\/api/, '')
       }
     }